@@ -1,23 +1,159 @@
 import os
-from flask import Flask, render_template, redirect, request, flash, url_for, session
+import io
+import csv
+import json
+import hashlib
+import tempfile
+import uuid
+import time
+import math
+import random
+import tracemalloc
+import threading
+import queue
+import sqlite3
+import click
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial, wraps
+from types import SimpleNamespace
+from flask import Flask, render_template, make_response, redirect, request, flash, url_for, session, g, jsonify, Response, has_request_context, stream_with_context, send_from_directory, abort
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text, tuple_, or_, and_, insert, update, delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable, CreateIndex
+from sqlalchemy.orm.exc import StaleDataError
 from werkzeug.security import check_password_hash, generate_password_hash
-from datetime import datetime
+from markupsafe import Markup, escape
+from PIL import Image
+import numpy as np
+from datetime import datetime, date, timedelta
 
 curr_dir = os.path.dirname(os.path.abspath(__file__))
 
 app = Flask(__name__)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///household_services.sqlite3"
+# Database, the DATABASE_URL environment variable replaces the SQLite file with another one.
+# Only SQLite is supported, the schema upgrades, search index, triggers and rollups use its SQL.
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL", "sqlite:///household_services.sqlite3")
+# Connections kept open by each worker process, and how many more may be opened under load.
+# An in-memory database has a single connection and takes no pool options.
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+if make_url(app.config['SQLALCHEMY_DATABASE_URI']).database not in [None, "", ":memory:"]:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        "pool_size": int(os.environ.get("DATABASE_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DATABASE_MAX_OVERFLOW", 10)),
+        "pool_timeout": 30,
+    }
+# Pragmas run on every new SQLite connection. WAL lets readers continue while a worker writes and
+# busy_timeout makes writers wait for the lock instead of failing with "database is locked".
+app.config['SQLITE_PRAGMAS'] = {
+    "journal_mode": "WAL",
+    "busy_timeout": 5000,
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = "tawp_sekret"
 
 app.config['UPLOAD_PATH'] = os.path.join(curr_dir, 'static', 'pdfs')
 
+# Largest resume accepted, bigger request bodies are refused before they are read
+app.config['MAX_RESUME_SIZE'] = 5 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_RESUME_SIZE'] + 64 * 1024
+# Resume downloads can be handed to the web server: USE_X_SENDFILE for Apache/lighttpd,
+# or the internal location nginx maps to UPLOAD_PATH for X-Accel-Redirect, e.g. "/protected/pdfs/"
+app.config['USE_X_SENDFILE'] = False
+app.config['RESUME_ACCEL_REDIRECT'] = None
+
+# Responsive variants of the static images, made by `flask build-images`
+app.config['IMAGE_WIDTHS'] = [480, 960, 1440]
+app.config['IMAGE_BUILD_PATH'] = os.path.join(curr_dir, 'static', 'build')
+
+# File holding the version stamp of the service catalog, shared by all workers on the machine so a service
+# changed in one worker is reloaded by the others. None keeps the stamp in memory, only for a single worker process.
+app.config['CATALOG_VERSION_FILE'] = os.path.join(app.instance_path, "catalog_version")
+
+# Seconds an identity check stays cached per user, blocking is seen by other workers within this time. 0 disables.
+app.config['IDENTITY_CACHE_TTL'] = 5
+app.config['IDENTITY_CACHE_SIZE'] = 4096
+
+# Professionals shown for a service, ranked by closeness of pincodes, rating and accepted requests.
+# PINCODE_CENTROIDS is an optional CSV with pincode,latitude,longitude columns to measure closeness in km,
+# a professional MATCH_DISTANCE_SCALE km away counts half as close as one next door.
+app.config['MATCH_TOP_K'] = 20
+app.config['MATCH_WEIGHTS'] = {"distance": 0.5, "rating": 0.3, "load": 0.2}
+app.config['MATCH_DISTANCE_SCALE'] = 10
+app.config['PINCODE_CENTROIDS'] = None
+# Seconds before the pincode index is rebuilt, approvals by other workers are seen within this time
+app.config['MATCH_INDEX_MAX_AGE'] = 300
+
+# Seconds between reads of new request events, one reader thread per worker serves every open dashboard.
+# The last EVENT_BUFFER_SIZE events are kept so reconnecting browsers catch up without reloading.
+app.config['EVENT_POLL_INTERVAL'] = 1.0
+app.config['EVENT_HEARTBEAT'] = 15
+app.config['EVENT_BUFFER_SIZE'] = 1000
+# Seconds request events are kept in the outbox
+app.config['EVENT_RETENTION'] = 24 * 3600
+
+# Largest batch of professionals moderated at once
+app.config['MODERATION_MAX_IDS'] = 10000
+
+# Days shown by the summary charts, and how many waiting request changes a summary page counts
+# itself before showing the rollups, more than that are left to `flask rollup-requests`
+app.config['ROLLUP_DAYS'] = 365
+app.config['ROLLUP_INLINE_CHANGES'] = 1000
+
+# Closed and rejected requests older than ARCHIVE_AFTER_DAYS are moved to the archive by `flask archive-requests`,
+# ARCHIVE_BATCH_SIZE at a time
+app.config['ARCHIVE_AFTER_DAYS'] = 365
+app.config['ARCHIVE_BATCH_SIZE'] = 1000
+
+# Login and register attempts allowed per client IP and per username: (burst, tokens refilled per second).
+# RATE_LIMIT_DB is an SQLite file for buckets shared by all workers on the machine, None keeps them per process.
+app.config['RATE_LIMITS'] = {"ip": (20, 0.5), "username": (5, 0.05)}
+app.config['RATE_LIMIT_DB'] = None
+app.config['RATE_LIMIT_SIZE'] = 65536
+
+# Seconds between runs of the dispatcher thread, None turns it off. Public requests nobody accepted within
+# DISPATCH_ASSIGN_AFTER seconds are assigned to a professional, DISPATCH_BATCH_SIZE per run, and requests still
+# waiting REQUEST_TTL_DAYS after they were made expire. One worker at a time dispatches, holding the lease for DISPATCH_LEASE seconds.
+app.config['DISPATCH_INTERVAL'] = 30
+app.config['DISPATCH_ASSIGN_AFTER'] = 900
+app.config['DISPATCH_BATCH_SIZE'] = 500
+app.config['DISPATCH_LEASE'] = 90
+app.config['REQUEST_TTL_DAYS'] = 30
+
+# Number of recent requests per endpoint kept for the latency percentiles
+app.config['METRICS_WINDOW'] = 1024
+
+# Rows per page of the list pages, can be changed per request with ?per_page= up to the maximum
+app.config['PAGE_SIZE'] = 50
+app.config['MAX_PAGE_SIZE'] = 500
+
+# Werkzeug hash method with its cost, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+# Hashes made with other parameters are replaced on the next successful login.
+app.config['PASSWORD_HASH_METHOD'] = "scrypt:32768:8:1"
+# Threads doing password hashing for all requests together, 0 hashes on the request thread
+app.config['PASSWORD_HASH_WORKERS'] = os.cpu_count() or 1
+
 db = SQLAlchemy()
 
 db.init_app(app)
 
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute("PRAGMA " + name + " = " + str(value))
+    cursor.close()
+
+with app.app_context():
+    if db.engine.dialect.name == "sqlite":
+        event.listen(db.engine, "connect", apply_sqlite_pragmas)
+
 
 # ORM -> Object Relational Mapping
 
@@ -28,7 +164,7 @@ class Customer(db.Model):
     password = db.Column(db.String(80), nullable=False)
     first_name = db.Column(db.String(80), nullable=False)
     last_name = db.Column(db.String(80))
-    date_created = db.Column(db.String(80), default=datetime.now().date().strftime("%d/%m/%Y"))
+    date_created = db.Column(db.Date, default=date.today, server_default=db.func.current_date(), index=True)
     address = db.Column(db.String(80), nullable=False)
     pin_code = db.Column(db.Integer, nullable=False)
     contact = db.Column(db.Integer, nullable=False)
@@ -43,14 +179,17 @@ class ServiceProfessional(db.Model):
     password = db.Column(db.String(80), nullable=False)
     first_name = db.Column(db.String(80), nullable=False)
     last_name = db.Column(db.String(80))
-    date_created = db.Column(db.String(80), default = datetime.now().date().strftime("%d/%m/%Y"))
+    date_created = db.Column(db.Date, default=date.today, server_default=db.func.current_date(), index=True)
     description = db.Column(db.String(150), nullable=False)
     service_type = db.Column(db.String(80), db.ForeignKey("services.name"), nullable=False)
     experience = db.Column(db.Integer, nullable=False)
     resume = db.Column(db.String(80))
     contact = db.Column(db.Integer, nullable=False)
     approval_status = db.Column(db.String(80), default="Pending")
-    avg_rating = db.Column(db.Integer, default=0)
+    avg_rating = db.Column(db.Integer, default=0, index=True)
+    # Running totals of closed request ratings, avg_rating = rating_sum / rating_count
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     pincode = db.Column(db.String(6), nullable=False)
 
     # One-to-Many relationship between professional and service requests
@@ -76,14 +215,375 @@ class ServiceRequest(db.Model):
     service_id = db.Column(db.Integer, db.ForeignKey("services.serv_id"))
     customer_id = db.Column(db.Integer, db.ForeignKey("customer.cust_id"))
     professional_id = db.Column(db.Integer, db.ForeignKey("serviceprofessional.pro_id"))
-    date_of_request = db.Column(db.String(80), default = datetime.now().date().strftime("%d/%m/%Y"))
-    date_of_completion = db.Column(db.String(80))
+    date_of_request = db.Column(db.Date, default=date.today, server_default=db.func.current_date(), index=True)
+    date_of_completion = db.Column(db.Date, index=True)
     service_status = db.Column(db.String(80), default="Requested")
     ratings = db.Column(db.Integer, default=0)
     remarks = db.Column(db.String(150))
+    # Time of the last change, part of the version stamp of the professional inbox
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    # Incremented on every change, an update based on an outdated copy of the request fails instead of overwriting it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # Indexes for counting requests per status, overall and per customer or professional
+    __table_args__ = (
+        db.Index("ix_servicerequest_status", "service_status"),
+        db.Index("ix_servicerequest_customer_status", "customer_id", "service_status"),
+        db.Index("ix_servicerequest_professional_status", "professional_id", "service_status"),
+        # Ids of archived requests are never given out again
+        {"sqlite_autoincrement": True},
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+# Closed and rejected requests moved out of servicerequest by `flask archive-requests`, and the requests
+# of deleted services and professionals. Pages only read the live table, the archive keeps the history.
+class ArchivedServiceRequest(db.Model):
+    __tablename__="archived_service_request"
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    service_id = db.Column(db.Integer)
+    customer_id = db.Column(db.Integer)
+    professional_id = db.Column(db.Integer)
+    date_of_request = db.Column(db.Date)
+    date_of_completion = db.Column(db.Date)
+    service_status = db.Column(db.String(80))
+    ratings = db.Column(db.Integer)
+    remarks = db.Column(db.String(150))
+    updated_at = db.Column(db.DateTime)
+    version = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, server_default=db.func.current_timestamp(), index=True)
 
-with app.app_context():
+    __table_args__ = (
+        db.Index("ix_archived_service_request_day_service", "date_of_request", "service_id"),
+    )
+
+# Outbox of request changes, read by the event stream of the dashboards
+class RequestEvent(db.Model):
+    __tablename__="requestevent"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True, nullable=False)
+    request_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    customer_id = db.Column(db.Integer)
+    professional_id = db.Column(db.Integer)
+    service_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+# Worker allowed to run the dispatcher until expires_at, renewed on every run
+class DispatchLease(db.Model):
+    __tablename__="dispatchlease"
+    name = db.Column(db.String(40), primary_key=True)
+    holder = db.Column(db.String(80), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# Requests per day, service and status, kept up to date by update_rollups()
+class RequestRollup(db.Model):
+    __tablename__="requestrollup"
+    day = db.Column(db.Date, primary_key=True)
+    service_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(80), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    # Closed requests rated 1 to 5, and closed requests per number of days from request to completion
+    rating_counts = db.Column(db.JSON, nullable=False)
+    completion_days = db.Column(db.JSON, nullable=False)
+
+# Days and services whose rollups are outdated, filled by triggers on servicerequest.
+# The rows up to the highest id read are processed together and then deleted, that id is the watermark.
+class RollupChange(db.Model):
+    __tablename__="rollupchange"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True, nullable=False)
+    day = db.Column(db.Date)
+    service_id = db.Column(db.Integer)
+
+# Columns added after the first release, by table
+ADDED_COLUMNS = {
+    "serviceprofessional": [("rating_sum", "INTEGER NOT NULL DEFAULT 0"), ("rating_count", "INTEGER NOT NULL DEFAULT 0")],
+    "servicerequest": [("updated_at", "DATETIME"), ("version", "INTEGER NOT NULL DEFAULT 1")],
+}
+
+# Creating the tables, columns and indexes that are missing, run by `flask init-db`
+def create_tables():
     db.create_all()
+    # create_all skips existing tables, so columns added to them later are added here
+    for table, added in ADDED_COLUMNS.items():
+        columns = [row[1] for row in db.session.execute(text("PRAGMA table_info(" + table + ")"))]
+        for column, definition in added:
+            if column not in columns:
+                db.session.execute(text("ALTER TABLE " + table + " ADD COLUMN " + column + " " + definition))
+    db.session.commit()
+    rebuild_request_table()
+    # create_all skips existing tables, so indexes added to them later are created here
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Tables created without AUTOINCREMENT reuse the id of the newest request once it is archived,
+# SQLite can only add it by copying the requests into a new table. The rollup triggers go
+# with the old table and are created again by create_rollup_triggers().
+def rebuild_request_table():
+    definition = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'servicerequest'")).scalar()
+    if "AUTOINCREMENT" not in definition.upper():
+        db.session.execute(text("ALTER TABLE servicerequest RENAME TO servicerequest_old"))
+        for (name,) in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'servicerequest_old' AND sql IS NOT NULL")).all():
+            db.session.execute(text("DROP INDEX " + name))
+        db.session.execute(CreateTable(ServiceRequest.__table__))
+        for index in ServiceRequest.__table__.indexes:
+            db.session.execute(CreateIndex(index))
+        columns = ", ".join(column.name for column in ServiceRequest.__table__.columns)
+        db.session.execute(text("INSERT INTO servicerequest (" + columns + ") SELECT " + columns + " FROM servicerequest_old"))
+        db.session.execute(text("DROP TABLE servicerequest_old"))
+    # New requests are numbered after the archived ones too
+    archived = db.session.query(db.func.max(ArchivedServiceRequest.id)).scalar()
+    if archived != None:
+        sequence = db.session.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'servicerequest'")).scalar()
+        if sequence == None:
+            db.session.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('servicerequest', :seq)"), {"seq": archived})
+        elif sequence < archived:
+            db.session.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'servicerequest'"), {"seq": archived})
+    db.session.commit()
+
+# Migrating dd/mm/YYYY date strings of older databases to ISO dates and indexing them
+
+DATE_COLUMNS = [
+    ("customer", "date_created"),
+    ("serviceprofessional", "date_created"),
+    ("servicerequest", "date_of_request"),
+    ("servicerequest", "date_of_completion"),
+]
+
+@app.cli.command("migrate-dates")
+def migrate_dates():
+    for table, column in DATE_COLUMNS:
+        result = db.session.execute(text(
+            "UPDATE " + table + " SET " + column + " = substr(" + column + ", 7, 4) || '-' || substr(" + column + ", 4, 2) || '-' || substr(" + column + ", 1, 2) "
+            "WHERE " + column + " LIKE '__/__/____'"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_" + table + "_" + column + " ON " + table + " (" + column + ")"))
+        click.echo(table + "." + column + ": " + str(result.rowcount) + " rows converted")
+    # The rollup triggers logged the old days of the converted requests, which are not dates
+    if db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollupchange'")).first() != None:
+        db.session.execute(text("DELETE FROM rollupchange WHERE day LIKE '__/__/____'"))
+    db.session.commit()
+
+# Rebuilding the rating totals of every professional from closed requests with one GROUP BY
+
+@app.cli.command("rebuild-ratings")
+def rebuild_ratings():
+    click.echo(str(update_rating_totals()) + " professionals with ratings")
+
+def update_rating_totals():
+    db.session.execute(text("UPDATE serviceprofessional SET rating_sum = 0, rating_count = 0, avg_rating = 0"))
+    result = db.session.execute(text(
+        "UPDATE serviceprofessional SET rating_sum = totals.rating_sum, rating_count = totals.rating_count, avg_rating = totals.rating_sum * 1.0 / totals.rating_count "
+        "FROM (SELECT professional_id, SUM(ratings) AS rating_sum, COUNT(*) AS rating_count FROM ("
+        # Archived requests keep counting, they only left the live table
+        "SELECT professional_id, ratings FROM servicerequest WHERE service_status = 'Closed' AND professional_id IS NOT NULL "
+        "UNION ALL SELECT professional_id, ratings FROM archived_service_request WHERE service_status = 'Closed' AND professional_id IS NOT NULL"
+        ") GROUP BY professional_id) AS totals "
+        "WHERE serviceprofessional.pro_id = totals.professional_id"))
+    db.session.commit()
+    return result.rowcount
+
+# Bulk import of customers, professionals and services from CSV or JSONL files
+
+IMPORT_KINDS = {
+    # kind: (model, unique field, required fields, optional fields)
+    "customers": (Customer, "user_name", ["user_name", "password", "first_name", "address", "pin_code", "contact"], ["last_name"]),
+    "professionals": (ServiceProfessional, "user_name", ["user_name", "password", "first_name", "description", "service_type", "experience", "contact", "pincode"], ["last_name", "resume", "approval_status"]),
+    "services": (Services, "name", ["name", "price", "time_required", "description"], []),
+}
+
+def read_import_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.endswith(".jsonl"):
+            for line, content in enumerate(file, start=1):
+                if content.strip():
+                    try:
+                        yield line, json.loads(content)
+                    except ValueError:
+                        yield line, None
+        else:
+            for line, row in enumerate(csv.DictReader(file), start=2):
+                yield line, row
+
+def insert_import_batch(model, batch, pool):
+    if pool != None:
+        hasher = partial(generate_password_hash, method=app.config['PASSWORD_HASH_METHOD'])
+        hashes = pool.map(hasher, [row["password"] for row in batch], chunksize=max(1, len(batch) // 32))
+        for row, password_hash in zip(batch, hashes):
+            row["password"] = password_hash
+    db.session.execute(insert(model), batch)
+    db.session.commit()
+    return len(batch)
+
+@app.cli.command("import-data")
+@click.argument("kind", type=click.Choice(list(IMPORT_KINDS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=1000, show_default=True, help="Rows inserted per executemany and commit.")
+@click.option("--workers", default=None, type=int, help="Processes hashing passwords, defaults to the CPU count.")
+def import_data(kind, path, batch_size, workers):
+    model, unique_field, required, optional = IMPORT_KINDS[kind]
+    start = time.perf_counter()
+    existing = set(db.session.execute(db.select(getattr(model, unique_field))).scalars())
+    service_names = set(db.session.execute(db.select(Services.name)).scalars())
+    imported = 0
+    rejected = 0
+    batch = []
+    pool = ProcessPoolExecutor(max_workers=workers) if "password" in required else None
+    try:
+        for line, row in read_import_rows(path):
+            if row == None:
+                reason = "not valid JSON"
+            elif not isinstance(row, dict):
+                reason = "not a JSON object"
+            elif any(isinstance(row.get(field), (list, dict)) for field in required + optional):
+                reason = "nested value in " + ", ".join(field for field in required + optional if isinstance(row.get(field), (list, dict)))
+            elif any(row.get(field) in [None, ""] for field in required):
+                reason = "missing " + ", ".join(field for field in required if row.get(field) in [None, ""])
+            elif row[unique_field] in existing:
+                reason = unique_field + " " + str(row[unique_field]) + " already exists"
+            elif kind == "professionals" and row["service_type"] not in service_names:
+                reason = "unknown service " + str(row["service_type"])
+            else:
+                reason = None
+            if reason != None:
+                rejected += 1
+                click.echo("line " + str(line) + " rejected: " + reason, err=True)
+                continue
+            existing.add(row[unique_field])
+            batch.append({field: row[field] for field in required + optional if row.get(field) not in [None, ""]})
+            if len(batch) >= batch_size:
+                imported += insert_import_batch(model, batch, pool)
+                batch = []
+        if batch:
+            imported += insert_import_batch(model, batch, pool)
+        if model == Services:
+            invalidate_service_catalog()
+        elif model == ServiceProfessional:
+            reset_match_index()
+    finally:
+        if pool != None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - start
+    click.echo(str(imported) + " " + kind + " imported, " + str(rejected) + " rejected in " + ("%.2f" % elapsed) + "s (" + ("%.0f" % (imported / elapsed)) + " rows/s)")
+
+# Responsive Images
+# Every static photo gets WebP and JPEG copies at IMAGE_WIDTHS, named after a hash of their
+# content so they can be cached forever. manifest.json maps each original to its copies.
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+
+@app.cli.command("build-images")
+def build_images():
+    build_path = app.config['IMAGE_BUILD_PATH']
+    os.makedirs(build_path, exist_ok=True)
+    for name in os.listdir(build_path):
+        os.remove(os.path.join(build_path, name))
+    manifest = {}
+    for filename in sorted(os.listdir(app.static_folder)):
+        stem, extension = os.path.splitext(filename)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        with Image.open(os.path.join(app.static_folder, filename)) as original:
+            original = original.convert("RGB")
+            widths = [width for width in app.config['IMAGE_WIDTHS'] if width < original.width] or [original.width]
+            entry = {"width": original.width, "height": original.height, "webp": [], "jpeg": []}
+            for width in widths:
+                resized = original.resize((width, round(original.height * width / original.width)), Image.LANCZOS)
+                for image_format, options in [("webp", {"quality": 80, "method": 6}), ("jpeg", {"quality": 82, "optimize": True, "progressive": True})]:
+                    buffer = io.BytesIO()
+                    resized.save(buffer, image_format.upper(), **options)
+                    data = buffer.getvalue()
+                    variant = stem + "-" + str(width) + "." + hashlib.sha256(data).hexdigest()[:10] + "." + ("jpg" if image_format == "jpeg" else image_format)
+                    with open(os.path.join(build_path, variant), "wb") as file:
+                        file.write(data)
+                    entry[image_format].append([width, "build/" + variant])
+        manifest[filename] = entry
+        click.echo(filename + ": " + ", ".join(str(width) + "w" for width in widths))
+    with open(os.path.join(build_path, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+image_manifest_cache = {"mtime": None, "manifest": {}}
+
+def image_manifest():
+    path = os.path.join(app.config['IMAGE_BUILD_PATH'], "manifest.json")
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    if image_manifest_cache["mtime"] != mtime:
+        with open(path) as file:
+            image_manifest_cache["manifest"] = json.load(file)
+        image_manifest_cache["mtime"] = mtime
+    return image_manifest_cache["manifest"]
+
+# <picture> with WebP and JPEG srcsets of a static image, or a plain <img> before images are built
+@app.template_global()
+def responsive_image(filename, sizes="(min-width: 768px) 50vw, 100vw", **attributes):
+    attributes = "".join(" " + key + '="' + str(escape(value)) + '"' for key, value in attributes.items())
+    entry = image_manifest().get(filename)
+    if entry == None:
+        return Markup('<img src="' + str(escape(url_for("static", filename=filename))) + '"' + attributes + ">")
+    webp = ", ".join(url_for("static", filename=path) + " " + str(width) + "w" for width, path in entry["webp"])
+    jpeg = ", ".join(url_for("static", filename=path) + " " + str(width) + "w" for width, path in entry["jpeg"])
+    fallback = url_for("static", filename=entry["jpeg"][-1][1])
+    return Markup('<picture><source type="image/webp" srcset="' + str(escape(webp)) + '" sizes="' + str(escape(sizes)) + '">'
+                  + '<img src="' + str(escape(fallback)) + '" srcset="' + str(escape(jpeg)) + '" sizes="' + str(escape(sizes)) + '"' + attributes + "></picture>")
+
+# Hashed image variants never change, so browsers may keep them for a year without revalidating
+@app.after_request
+def cache_built_images(response):
+    if request.endpoint == "static" and request.view_args.get("filename", "").startswith("build/") and response.status_code == 200:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+# Full-text search index over customers, professionals and services
+# rowid = id * 3 + kind, so triggers can update a single entry without scanning the index
+
+SEARCH_CUSTOMER = 0
+SEARCH_PROFESSIONAL = 1
+SEARCH_SERVICE = 2
+
+# (table, key, kind, indexed values, columns whose updates change the index entry)
+SEARCH_SOURCES = [
+    ("customer", "cust_id", SEARCH_CUSTOMER, "new.user_name, new.first_name, new.last_name, NULL, new.pin_code", "user_name, first_name, last_name, pin_code"),
+    ("serviceprofessional", "pro_id", SEARCH_PROFESSIONAL, "new.user_name, new.first_name, new.last_name, NULL, new.pincode", "user_name, first_name, last_name, pincode"),
+    ("services", "serv_id", SEARCH_SERVICE, "NULL, NULL, NULL, new.name, NULL", "name"),
+]
+
+def create_search_index():
+    db.session.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(user_name, first_name, last_name, name, pincode, prefix='2 3 4')"))
+    for table, key, kind, values, columns in SEARCH_SOURCES:
+        rowid = "new." + key + " * 3 + " + str(kind)
+        insert = "INSERT INTO search_index (rowid, user_name, first_name, last_name, name, pincode) VALUES (" + rowid + ", " + values + ");"
+        delete = "DELETE FROM search_index WHERE rowid = old." + key + " * 3 + " + str(kind) + ";"
+        db.session.execute(text("CREATE TRIGGER IF NOT EXISTS " + table + "_search_insert AFTER INSERT ON " + table + " BEGIN " + insert + " END"))
+        # Updates of other columns, like ratings and approvals, leave the index alone.
+        # Databases created with a trigger on every update get it replaced.
+        update_trigger = "CREATE TRIGGER " + table + "_search_update AFTER UPDATE OF " + columns + " ON " + table + " BEGIN " + delete + " " + insert + " END"
+        existing = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :name"), {"name": table + "_search_update"}).scalar()
+        if existing != update_trigger:
+            db.session.execute(text("DROP TRIGGER IF EXISTS " + table + "_search_update"))
+            db.session.execute(text(update_trigger))
+        db.session.execute(text("CREATE TRIGGER IF NOT EXISTS " + table + "_search_delete AFTER DELETE ON " + table + " BEGIN " + delete + " END"))
+    db.session.commit()
+
+# Schema creation is a separate step so that web workers starting together do not race on it,
+# every statement checks what exists first so it is safe to run on every deploy
+@app.cli.command("init-db")
+def init_db():
+    create_tables()
+    create_search_index()
+    create_rollup_triggers()
+    click.echo("Database schema is up to date")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    db.session.execute(text("DELETE FROM search_index"))
+    for table, key, kind, values, columns in SEARCH_SOURCES:
+        result = db.session.execute(text(
+            "INSERT INTO search_index (rowid, user_name, first_name, last_name, name, pincode) "
+            "SELECT " + key + " * 3 + " + str(kind) + ", " + values.replace("new.", "") + " FROM " + table))
+        click.echo(table + ": " + str(result.rowcount) + " rows indexed")
+    db.session.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    db.session.commit()
 
 # Initialization of session variables
 def init_session():
@@ -96,6 +596,897 @@ def init_session():
 def before_request():
     init_session()
 
+# Current User
+# The logged in customer or professional is loaded at most once per request into g.
+# Whether a user may use their dashboard is also kept in a small LRU for a few seconds,
+# so routes that only need the check do not query at all.
+
+identity_cache = OrderedDict()
+identity_cache_lock = threading.Lock()
+
+def current_customer():
+    if "customer" not in g:
+        g.customer = None
+        if isinstance(session.get("user_id"), int):
+            g.customer = db.session.get(Customer, session["user_id"])
+    return g.customer
+
+def current_professional():
+    if "professional" not in g:
+        g.professional = None
+        if isinstance(session.get("user_id"), int):
+            g.professional = db.session.get(ServiceProfessional, session["user_id"])
+    return g.professional
+
+def identity_allowed(role):
+    if session.get("user_role") not in [None, role]:
+        return False
+    key = (role, session.get("user_id"))
+    now = time.monotonic()
+    with identity_cache_lock:
+        cached = identity_cache.get(key)
+        if cached != None and cached[1] > now:
+            identity_cache.move_to_end(key)
+            return cached[0]
+    if role == "customer":
+        allowed = current_customer() != None
+    else:
+        professional = current_professional()
+        allowed = professional != None and professional.approval_status == "Approved"
+    if app.config['IDENTITY_CACHE_TTL'] > 0:
+        with identity_cache_lock:
+            identity_cache[key] = (allowed, now + app.config['IDENTITY_CACHE_TTL'])
+            identity_cache.move_to_end(key)
+            while len(identity_cache) > app.config['IDENTITY_CACHE_SIZE']:
+                identity_cache.popitem(last=False)
+    return allowed
+
+# Called when an admin changes whether a user may log in
+def forget_identity(role, user_id):
+    with identity_cache_lock:
+        identity_cache.pop((role, user_id), None)
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get("user_id") == "admin" and session.get("user_username") == "admin":
+            return view(*args, **kwargs)
+        flash("Unauthorized Access", "error")
+        return redirect(url_for("home"))
+    return wrapper
+
+def customer_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if isinstance(session.get("user_id"), int) and identity_allowed("customer"):
+            return view(*args, **kwargs)
+        flash("Unauthorised Access","error")
+        return redirect(url_for("home"))
+    return wrapper
+
+def professional_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if isinstance(session.get("user_id"), int) and identity_allowed("professional"):
+            return view(*args, **kwargs)
+        flash("Unauthorised Access","error")
+        return redirect(url_for("home"))
+    return wrapper
+
+# Dates are stored as ISO dates but shown as dd/mm/YYYY like before
+@app.template_filter("display_date")
+def display_date(value):
+    if value == None:
+        return value
+    return value.strftime("%d/%m/%Y")
+
+# Request Instrumentation
+
+route_metrics = {}
+route_metrics_lock = threading.Lock()
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.db_time = 0.0
+    g.db_statements = 0
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start_time = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "request_start" in g:
+        g.db_time += time.perf_counter() - context.query_start_time
+        g.db_statements += 1
+
+with app.app_context():
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(db.engine, "after_cursor_execute", after_cursor_execute)
+
+@app.teardown_request
+def record_request_metrics(exception):
+    if "request_start" not in g:
+        return
+    sample = (time.perf_counter() - g.request_start, g.db_time, g.db_statements)
+    endpoint = request.endpoint or "unknown"
+    with route_metrics_lock:
+        if endpoint not in route_metrics:
+            route_metrics[endpoint] = {"count": 0, "samples": deque(maxlen=app.config['METRICS_WINDOW'])}
+        route_metrics[endpoint]["count"] += 1
+        route_metrics[endpoint]["samples"].append(sample)
+
+def percentile(values, q):
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+def metrics_snapshot():
+    with route_metrics_lock:
+        copied = {endpoint: (m["count"], list(m["samples"])) for endpoint, m in route_metrics.items()}
+    snapshot = {}
+    for endpoint, (count, samples) in copied.items():
+        stats = {"count": count}
+        for index, name in enumerate(["wall_seconds", "db_seconds", "db_statements"]):
+            values = sorted(sample[index] for sample in samples)
+            stats[name] = {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "p99": percentile(values, 0.99)}
+        snapshot[endpoint] = stats
+    with rate_buckets_lock:
+        for endpoint, shed in rate_limit_shed.items():
+            snapshot.setdefault(endpoint, {"count": 0})["shed"] = dict(shed)
+    return snapshot
+
+# Rate Limiting
+# Login and register attempts take a token from the bucket of the client IP and of the username.
+# Buckets refill continuously up to their burst size, an empty bucket answers 429 before the
+# request reaches the database or the password hashing.
+
+RATE_LIMITED_ENDPOINTS = {
+    # endpoint: (template, function giving the template context)
+    "customer_login": ("customer_login.html", dict),
+    "employee_login": ("employee_login.html", dict),
+    "customer_register": ("customer_register.html", dict),
+    "employee_register": ("employee_register.html", lambda: {"services": service_catalog()}),
+}
+
+# key: (tokens, time of the last update), the least recently used keys are dropped beyond RATE_LIMIT_SIZE
+rate_buckets = OrderedDict()
+rate_buckets_lock = threading.Lock()
+rate_limit_shed = {}
+rate_limit_local = threading.local()
+
+def rate_limit_connection():
+    path = app.config['RATE_LIMIT_DB']
+    if getattr(rate_limit_local, "path", None) != path:
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID")
+        rate_limit_local.connection = connection
+        rate_limit_local.path = path
+    return rate_limit_local.connection
+
+# Takes a token from the bucket of key, returns the seconds to wait when there is none
+def take_token(key, burst, rate):
+    now = time.time()
+    if app.config['RATE_LIMIT_DB'] != None:
+        # One statement reads, refills and takes from the shared bucket, so concurrent workers cannot both take the last token
+        tokens, allowed = rate_limit_connection().execute(
+            "INSERT INTO rate_bucket (key, tokens, updated, allowed) VALUES (:key, :burst - 1, :now, 1) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "tokens = min(:burst, tokens + (:now - updated) * :rate) - (min(:burst, tokens + (:now - updated) * :rate) >= 1), "
+            "allowed = min(:burst, tokens + (:now - updated) * :rate) >= 1, updated = :now "
+            "RETURNING tokens, allowed", {"key": key, "burst": burst, "rate": rate, "now": now}).fetchone()
+        return 0 if allowed else (1 - tokens) / rate
+    with rate_buckets_lock:
+        tokens, updated = rate_buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / rate
+        rate_buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+        while len(rate_buckets) > app.config['RATE_LIMIT_SIZE']:
+            rate_buckets.popitem(last=False)
+    return wait
+
+@app.before_request
+def limit_request_rate():
+    if request.method != "POST" or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+    keys = [("ip", request.remote_addr or ""), ("username", request.form.get("username", "").strip().lower())]
+    for kind, value in keys:
+        burst, rate = app.config['RATE_LIMITS'][kind]
+        wait = take_token(kind + ":" + value, burst, rate)
+        if wait > 0:
+            with rate_buckets_lock:
+                shed = rate_limit_shed.setdefault(request.endpoint, {"ip": 0, "username": 0})
+                shed[kind] += 1
+            flash("Too many attempts, please try again in " + str(math.ceil(wait)) + " seconds","error")
+            template, context = RATE_LIMITED_ENDPOINTS[request.endpoint]
+            response = make_response(render_template(template, **context()), 429)
+            response.headers["Retry-After"] = str(math.ceil(wait))
+            return response
+    return None
+
+# Service Catalog Cache
+# Dashboards show every service in rows of five, this changes only when an admin edits the
+# services, so the grid is kept in memory until the catalog version stamp changes
+
+service_catalog_cache = {"local_version": 0, "version": None, "services": [], "grid": []}
+service_catalog_lock = threading.Lock()
+
+def service_catalog_version():
+    shared = None
+    if app.config['CATALOG_VERSION_FILE'] != None:
+        try:
+            with open(app.config['CATALOG_VERSION_FILE']) as file:
+                shared = file.read()
+        except OSError:
+            shared = ""
+    return (service_catalog_cache["local_version"], shared)
+
+# Called after every commit that changes Services
+def invalidate_service_catalog():
+    with service_catalog_lock:
+        service_catalog_cache["local_version"] += 1
+    path = app.config['CATALOG_VERSION_FILE']
+    if path != None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stamp = uuid.uuid4().hex
+        with open(path + "." + stamp, "w") as file:
+            file.write(stamp)
+        os.replace(path + "." + stamp, path)
+
+def load_service_catalog():
+    version = service_catalog_version()
+    if service_catalog_cache["version"] != version:
+        with service_catalog_lock:
+            if service_catalog_cache["version"] != version:
+                services = [SimpleNamespace(serv_id=s.serv_id, name=s.name, price=s.price, time_required=s.time_required, description=s.description)
+                            for s in Services.query.order_by(Services.serv_id).all()]
+                service_catalog_cache["services"] = services
+                service_catalog_cache["grid"] = [services[i:i + 5] for i in range(0, len(services), 5)]
+                service_catalog_cache["version"] = version
+    return service_catalog_cache
+
+def service_catalog():
+    return load_service_catalog()["services"]
+
+def service_grid():
+    return load_service_catalog()["grid"]
+
+# Professional Matching
+# Approved professionals are kept in a trie of their pincode digits per service, pincodes sharing
+# more leading digits are closer. The candidates nearest to the customer are ranked by closeness,
+# rating and the number of requests they have accepted, which are read fresh for every ranking.
+
+match_index = {"loaded_at": None, "services": {}, "professionals": {}}
+match_index_lock = threading.Lock()
+
+def new_trie_node():
+    return {"ids": set(), "children": {}}
+
+def add_to_match_index(pro_id, service_type, pincode):
+    remove_from_match_index(pro_id)
+    node = match_index["services"].setdefault(service_type, new_trie_node())
+    node["ids"].add(pro_id)
+    for digit in pincode:
+        node = node["children"].setdefault(digit, new_trie_node())
+        node["ids"].add(pro_id)
+    match_index["professionals"][pro_id] = (service_type, pincode)
+
+def remove_from_match_index(pro_id):
+    entry = match_index["professionals"].pop(pro_id, None)
+    if entry == None:
+        return
+    service_type, pincode = entry
+    node = match_index["services"][service_type]
+    node["ids"].discard(pro_id)
+    for digit in pincode:
+        node = node["children"][digit]
+        node["ids"].discard(pro_id)
+
+# Rebuilt after MATCH_INDEX_MAX_AGE seconds so approvals made by other workers are picked up
+def load_match_index():
+    loaded_at = match_index["loaded_at"]
+    if loaded_at != None and time.monotonic() - loaded_at < app.config['MATCH_INDEX_MAX_AGE']:
+        return
+    rows = db.session.query(ServiceProfessional.pro_id, ServiceProfessional.service_type, ServiceProfessional.pincode).filter_by(approval_status="Approved").all()
+    with match_index_lock:
+        match_index["services"] = {}
+        match_index["professionals"] = {}
+        for pro_id, service_type, pincode in rows:
+            add_to_match_index(pro_id, service_type, str(pincode))
+        match_index["loaded_at"] = time.monotonic()
+
+# Called after a professional is approved, blocked or unblocked
+def update_match_index(professional):
+    with match_index_lock:
+        if match_index["loaded_at"] == None:
+            return
+        if professional.approval_status == "Approved":
+            add_to_match_index(professional.pro_id, professional.service_type, str(professional.pincode))
+        else:
+            remove_from_match_index(professional.pro_id)
+
+# Called after a professional is deleted
+def remove_from_match(pro_id):
+    with match_index_lock:
+        remove_from_match_index(pro_id)
+
+def reset_match_index():
+    with match_index_lock:
+        match_index["loaded_at"] = None
+
+# {pro_id: shared leading digits} of the professionals nearest to the pincode, widening
+# the prefix one digit at a time until there are enough candidates
+def match_candidates(service_type, pincode, limit):
+    with match_index_lock:
+        node = match_index["services"].get(service_type)
+        if node == None:
+            return {}
+        path = [node]
+        for digit in pincode:
+            node = node["children"].get(digit)
+            if node == None:
+                break
+            path.append(node)
+        candidates = {}
+        for depth in range(len(path) - 1, -1, -1):
+            for pro_id in path[depth]["ids"]:
+                candidates.setdefault(pro_id, depth)
+            if len(candidates) >= limit:
+                break
+        return candidates
+
+pincode_centroids_cache = {"path": None, "mtime": None, "centroids": {}}
+
+# {pincode: (latitude, longitude)} from the PINCODE_CENTROIDS CSV, empty without one
+def pincode_centroids():
+    path = app.config['PINCODE_CENTROIDS']
+    if path == None:
+        return {}
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    if pincode_centroids_cache["path"] != path or pincode_centroids_cache["mtime"] != mtime:
+        centroids = {}
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                try:
+                    centroids[row["pincode"].strip()] = (float(row["latitude"]), float(row["longitude"]))
+                except (KeyError, ValueError, AttributeError):
+                    continue
+        pincode_centroids_cache.update(path=path, mtime=mtime, centroids=centroids)
+    return pincode_centroids_cache["centroids"]
+
+def distance_km(origin, destination):
+    lat1, lon1, lat2, lon2 = map(math.radians, [origin[0], origin[1], destination[0], destination[1]])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+# (distance in km or None, score) of a professional for a customer pincode, shared_digits is their value in match_candidates()
+def match_score(pincode, professional_pincode, shared_digits, rating, load, centroids):
+    weights = app.config['MATCH_WEIGHTS']
+    distance = None
+    origin = centroids.get(pincode)
+    if origin != None and str(professional_pincode) in centroids:
+        distance = distance_km(origin, centroids[str(professional_pincode)])
+        closeness = 1 / (1 + distance / app.config['MATCH_DISTANCE_SCALE'])
+    else:
+        closeness = shared_digits / max(len(pincode), 1)
+    return distance, weights["distance"] * closeness + weights["rating"] * (rating or 0) / 5 + weights["load"] / (1 + load)
+
+# Best top_k approved professionals of a service for a customer pincode, as
+# (professional, distance in km or None, accepted requests, score) with the best first
+def match_professionals(service_type, pincode, top_k=None):
+    load_match_index()
+    top_k = top_k or app.config['MATCH_TOP_K']
+    pincode = str(pincode)
+    # A few times more candidates than shown, so nearby busy professionals do not crowd out the rest
+    candidates = match_candidates(service_type, pincode, top_k * 4)
+    if not candidates:
+        return []
+    load = db.session.query(ServiceRequest.professional_id, db.func.count().label("accepted")) \
+        .filter(ServiceRequest.professional_id.in_(candidates), ServiceRequest.service_status == "Accepted") \
+        .group_by(ServiceRequest.professional_id).subquery()
+    rows = db.session.query(ServiceProfessional, db.func.coalesce(load.c.accepted, 0)) \
+        .outerjoin(load, load.c.professional_id == ServiceProfessional.pro_id) \
+        .filter(ServiceProfessional.pro_id.in_(candidates), ServiceProfessional.approval_status == "Approved").all()
+    centroids = pincode_centroids()
+    matches = []
+    for professional, accepted in rows:
+        distance, score = match_score(pincode, professional.pincode, candidates[professional.pro_id], professional.avg_rating, accepted, centroids)
+        matches.append((professional, distance, accepted, score))
+    matches.sort(key=lambda match: (-match[3], match[0].pro_id))
+    return matches[:top_k]
+
+# Request Events
+# Creating, accepting, rejecting and closing a request also writes a row to the requestevent outbox
+# in the same transaction. One thread per worker reads new rows and hands each one to the
+# connected dashboards it concerns, however many browsers are listening.
+
+event_broker = {"subscribers": [], "recent": deque(maxlen=app.config['EVENT_BUFFER_SIZE']), "last_id": None, "thread": None}
+event_broker_lock = threading.Lock()
+
+# Adds the events of requests to the current transaction, with their customer, professional and service as they are now
+def record_request_event(kind, *request_ids):
+    db.session.execute(insert(RequestEvent).from_select(
+        ["request_id", "kind", "customer_id", "professional_id", "service_id", "created_at"],
+        db.select(ServiceRequest.id, db.literal(kind), ServiceRequest.customer_id, ServiceRequest.professional_id, ServiceRequest.service_id, db.literal(datetime.now()))
+        .where(ServiceRequest.id.in_(request_ids))))
+
+# Customers hear about their own requests, professionals about theirs and about public requests of their service
+def event_concerns(event, subscriber):
+    if subscriber["role"] == "customer":
+        return event["customer_id"] == subscriber["user_id"]
+    if event["professional_id"] == subscriber["user_id"]:
+        return True
+    return event["service_id"] == subscriber["service_id"] and (event["professional_id"] == None or event["kind"] in ["accepted", "rejected", "assigned"])
+
+def deliver_event(event, subscriber):
+    try:
+        subscriber["queue"].put_nowait(event)
+    except queue.Full:
+        subscriber["behind"] = True
+
+# Deletes events older than EVENT_RETENTION, run by the dispatcher and by the event reader
+def prune_request_events():
+    pruned = db.session.query(RequestEvent).filter(RequestEvent.created_at < datetime.now() - timedelta(seconds=app.config['EVENT_RETENTION'])).delete(synchronize_session=False)
+    db.session.commit()
+    return pruned
+
+def poll_request_events():
+    pruned_at = 0
+    while True:
+        with event_broker_lock:
+            if not event_broker["subscribers"]:
+                event_broker["thread"] = None
+                return
+            last_id = event_broker["last_id"]
+        events = []
+        try:
+            with app.app_context():
+                if last_id == None:
+                    last_id = db.session.query(db.func.max(RequestEvent.id)).scalar() or 0
+                rows = db.session.query(RequestEvent).filter(RequestEvent.id > last_id).order_by(RequestEvent.id).limit(500).all()
+                events = [{"id": row.id, "request_id": row.request_id, "kind": row.kind, "customer_id": row.customer_id,
+                           "professional_id": row.professional_id, "service_id": row.service_id} for row in rows]
+                if time.monotonic() - pruned_at > 3600:
+                    prune_request_events()
+                    pruned_at = time.monotonic()
+        except Exception:
+            app.logger.exception("Reading request events failed")
+        with event_broker_lock:
+            event_broker["last_id"] = events[-1]["id"] if events else last_id
+            for event in events:
+                event_broker["recent"].append(event)
+                for subscriber in event_broker["subscribers"]:
+                    if event_concerns(event, subscriber):
+                        deliver_event(event, subscriber)
+        if len(events) < 500:
+            time.sleep(app.config['EVENT_POLL_INTERVAL'])
+
+# Registers a dashboard, replaying the events after last_event_id that are still buffered.
+# Marks the subscriber as behind when they are not, so the page reloads instead.
+def subscribe_events(subscriber, last_event_id):
+    with event_broker_lock:
+        if last_event_id != None:
+            recent = event_broker["recent"]
+            if recent:
+                subscriber["behind"] = last_event_id < recent[0]["id"] - 1
+            else:
+                subscriber["behind"] = last_event_id != event_broker["last_id"]
+            for event in recent:
+                if event["id"] > last_event_id and event_concerns(event, subscriber):
+                    deliver_event(event, subscriber)
+        event_broker["subscribers"].append(subscriber)
+        if event_broker["thread"] == None:
+            event_broker["thread"] = threading.Thread(target=poll_request_events, name="request-events", daemon=True)
+            event_broker["thread"].start()
+
+def unsubscribe_events(subscriber):
+    with event_broker_lock:
+        event_broker["subscribers"].remove(subscriber)
+
+# Request Dispatcher
+# A thread in every worker wakes up every DISPATCH_INTERVAL seconds, and the worker holding the lease
+# assigns public requests that waited too long to the best matching professional and expires requests
+# nobody handled. Assigned requests become private requests of the professional, who can still reject them.
+
+dispatcher = {"thread": None, "holder": uuid.uuid4().hex, "leader": False, "runs": 0, "assigned": 0, "expired": 0,
+              "unassigned": 0, "assignment_seconds": deque(maxlen=app.config['METRICS_WINDOW'])}
+dispatcher_lock = threading.Lock()
+
+# Takes or renews the lease, False while another worker holds it
+def acquire_dispatch_lease():
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=app.config['DISPATCH_LEASE'])
+    result = db.session.execute(update(DispatchLease)
+        .where(DispatchLease.name == "dispatcher", or_(DispatchLease.holder == dispatcher["holder"], DispatchLease.expires_at < now))
+        .values(holder=dispatcher["holder"], expires_at=expires_at))
+    if result.rowcount == 0:
+        if db.session.get(DispatchLease, "dispatcher") != None:
+            db.session.rollback()
+            return False
+        db.session.add(DispatchLease(name="dispatcher", holder=dispatcher["holder"], expires_at=expires_at))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        return True
+    db.session.commit()
+    return True
+
+# Expires old requests and assigns waiting public ones, returns (assigned, expired)
+def dispatch_requests():
+    now = datetime.now()
+    batch_size = app.config['DISPATCH_BATCH_SIZE']
+
+    stale = db.select(ServiceRequest.id).where(ServiceRequest.service_status == "Requested",
+        ServiceRequest.date_of_request < date.today() - timedelta(days=app.config['REQUEST_TTL_DAYS'])).limit(batch_size)
+    expired = db.session.execute(update(ServiceRequest)
+        .where(ServiceRequest.id.in_(stale), ServiceRequest.service_status == "Requested")
+        .values(service_status="Expired", version=ServiceRequest.version + 1)
+        .returning(ServiceRequest.id).execution_options(synchronize_session=False)).scalars().all()
+    if expired:
+        record_request_event("expired", *expired)
+    db.session.commit()
+
+    # Requests made before updated_at existed are counted from the start of their day
+    waiting_since = db.func.coalesce(ServiceRequest.updated_at, ServiceRequest.date_of_request)
+    rows = db.session.query(ServiceRequest.id, Services.name, Customer.pin_code, waiting_since)\
+        .join(Services, Services.serv_id == ServiceRequest.service_id)\
+        .outerjoin(Customer, Customer.cust_id == ServiceRequest.customer_id)\
+        .filter(ServiceRequest.professional_id == None, ServiceRequest.service_status == "Requested",
+                waiting_since < now - timedelta(seconds=app.config['DISPATCH_ASSIGN_AFTER']))\
+        .order_by(ServiceRequest.id).limit(batch_size).all()
+    assigned = []
+    if rows:
+        load_match_index()
+        # Requests a professional was given but has not answered yet count as load too
+        load = db.session.query(ServiceRequest.professional_id, db.func.count().label("load"))\
+            .filter(ServiceRequest.professional_id != None, ServiceRequest.service_status.in_(["Requested", "Accepted"]))\
+            .group_by(ServiceRequest.professional_id).subquery()
+        professionals = {pro_id: [pincode, rating, pending] for pro_id, pincode, rating, pending in
+                         db.session.query(ServiceProfessional.pro_id, ServiceProfessional.pincode, ServiceProfessional.avg_rating, db.func.coalesce(load.c.load, 0))
+                         .outerjoin(load, load.c.professional_id == ServiceProfessional.pro_id)
+                         .filter(ServiceProfessional.approval_status == "Approved", ServiceProfessional.service_type.in_({row[1] for row in rows}))}
+        centroids = pincode_centroids()
+        for request_id, service_type, pincode, since in rows:
+            pincode = str(pincode or "")
+            best = None
+            for pro_id, shared_digits in match_candidates(service_type, pincode, app.config['MATCH_TOP_K'] * 4).items():
+                if pro_id not in professionals:
+                    continue
+                professional_pincode, rating, pending = professionals[pro_id]
+                score = match_score(pincode, professional_pincode, shared_digits, rating, pending, centroids)[1]
+                if best == None or (score, -pro_id) > best[0]:
+                    best = ((score, -pro_id), pro_id)
+            if best == None:
+                continue
+            # A professional may have accepted the request since it was read
+            result = db.session.execute(update(ServiceRequest)
+                .where(ServiceRequest.id == request_id, ServiceRequest.professional_id == None, ServiceRequest.service_status == "Requested")
+                .values(professional_id=best[1], version=ServiceRequest.version + 1))
+            if result.rowcount:
+                professionals[best[1]][2] += 1
+                since = datetime.combine(since, datetime.min.time()) if not isinstance(since, datetime) else since
+                assigned.append((request_id, (now - since).total_seconds()))
+        if assigned:
+            record_request_event("assigned", *[request_id for request_id, waited in assigned])
+        db.session.commit()
+
+    # The outbox is kept short even when no dashboard is reading it
+    prune_request_events()
+
+    with dispatcher_lock:
+        dispatcher["runs"] += 1
+        dispatcher["assigned"] += len(assigned)
+        dispatcher["expired"] += len(expired)
+        dispatcher["unassigned"] = len(rows) - len(assigned)
+        dispatcher["assignment_seconds"].extend(waited for request_id, waited in assigned)
+    return len(assigned), len(expired)
+
+# One run of the dispatcher thread, only the worker holding the lease dispatches
+def dispatch_tick():
+    with app.app_context():
+        dispatcher["leader"] = acquire_dispatch_lease()
+        if dispatcher["leader"]:
+            return dispatch_requests()
+    return None
+
+def run_dispatcher():
+    while True:
+        interval = app.config['DISPATCH_INTERVAL']
+        if not interval:
+            with dispatcher_lock:
+                dispatcher["thread"] = None
+            return
+        try:
+            dispatch_tick()
+        except Exception:
+            app.logger.exception("Dispatching requests failed")
+        time.sleep(interval)
+
+# Started by the first request of each worker, so CLI commands never dispatch
+@app.before_request
+def start_dispatcher():
+    if dispatcher["thread"] != None or not app.config['DISPATCH_INTERVAL']:
+        return None
+    with dispatcher_lock:
+        if dispatcher["thread"] == None:
+            dispatcher["thread"] = threading.Thread(target=run_dispatcher, name="request-dispatcher", daemon=True)
+            dispatcher["thread"].start()
+    return None
+
+# Public requests waiting for a professional, read from the database so every worker reports the same queue
+def dispatch_snapshot():
+    waiting_since = db.func.coalesce(ServiceRequest.updated_at, ServiceRequest.date_of_request)
+    depth, oldest = db.session.query(db.func.count(ServiceRequest.id), db.func.min(waiting_since))\
+        .filter(ServiceRequest.professional_id == None, ServiceRequest.service_status == "Requested").one()
+    if oldest != None and not isinstance(oldest, datetime):
+        oldest = datetime.fromisoformat(str(oldest))
+    with dispatcher_lock:
+        samples = sorted(dispatcher["assignment_seconds"])
+        snapshot = {key: dispatcher[key] for key in ["leader", "runs", "assigned", "expired", "unassigned"]}
+    snapshot["queue_depth"] = depth
+    snapshot["oldest_waiting_seconds"] = (datetime.now() - oldest).total_seconds() if oldest != None else 0
+    if samples:
+        snapshot["assignment_seconds"] = {"p50": percentile(samples, 0.5), "p95": percentile(samples, 0.95), "p99": percentile(samples, 0.99)}
+    return snapshot
+
+@app.cli.command("dispatch-requests")
+def dispatch_requests_command():
+    assigned, expired = dispatch_requests()
+    click.echo("Assigned " + str(assigned) + " requests and expired " + str(expired))
+
+# Daily Rollups
+# Every change to a request marks its day and service as outdated, and update_rollups() counts
+# the requests of just those days and services again. The summaries read the small rollup table
+# instead of scanning all requests.
+
+def create_rollup_triggers():
+    insert_new = "INSERT INTO rollupchange (day, service_id) VALUES (new.date_of_request, new.service_id);"
+    insert_old = "INSERT INTO rollupchange (day, service_id) VALUES (old.date_of_request, old.service_id);"
+    db.session.execute(text("CREATE TRIGGER IF NOT EXISTS servicerequest_rollup_insert AFTER INSERT ON servicerequest BEGIN " + insert_new + " END"))
+    db.session.execute(text("CREATE TRIGGER IF NOT EXISTS servicerequest_rollup_update AFTER UPDATE OF date_of_request, date_of_completion, service_id, service_status, ratings "
+                            "ON servicerequest BEGIN " + insert_old + " " + insert_new + " END"))
+    db.session.execute(text("CREATE TRIGGER IF NOT EXISTS servicerequest_rollup_delete AFTER DELETE ON servicerequest BEGIN " + insert_old + " END"))
+    db.session.commit()
+
+# Recounts the outdated days and services, returns how many there were.
+# With a limit, nothing is done when more changes than that are waiting.
+def update_rollups(limit=None):
+    watermark = db.session.query(db.func.max(RollupChange.id)).scalar()
+    if watermark == None:
+        return 0
+    if limit != None and db.session.query(RollupChange).filter(RollupChange.id <= watermark).count() > limit:
+        return 0
+    cells = db.session.query(RollupChange.day, RollupChange.service_id).filter(RollupChange.id <= watermark, RollupChange.day != None, RollupChange.service_id != None).distinct().all()
+    for start in range(0, len(cells), 500):
+        chunk = [tuple(cell) for cell in cells[start:start + 500]]
+        db.session.query(RequestRollup).filter(tuple_(RequestRollup.day, RequestRollup.service_id).in_(chunk)).delete(synchronize_session=False)
+        # Archived requests still count, they only left the live table
+        rows = []
+        for model in [ServiceRequest, ArchivedServiceRequest]:
+            completion = db.cast(db.func.julianday(model.date_of_completion) - db.func.julianday(model.date_of_request), db.Integer)
+            rows += db.session.query(model.date_of_request, model.service_id, model.service_status, model.ratings, completion, db.func.count())\
+                .filter(tuple_(model.date_of_request, model.service_id).in_(chunk))\
+                .group_by(model.date_of_request, model.service_id, model.service_status, model.ratings, completion).all()
+        facts = {}
+        for day, service_id, status, rating, days, count in rows:
+            fact = facts.setdefault((day, service_id, status or "Requested"), {"day": day, "service_id": service_id, "status": status or "Requested",
+                                                                                 "requests": 0, "rating_counts": [0] * 5, "completion_days": {}})
+            fact["requests"] += count
+            if status == "Closed":
+                if rating in [1, 2, 3, 4, 5]:
+                    fact["rating_counts"][rating - 1] += count
+                if days != None:
+                    fact["completion_days"][str(days)] = fact["completion_days"].get(str(days), 0) + count
+        if facts:
+            db.session.execute(insert(RequestRollup), list(facts.values()))
+    db.session.query(RollupChange).filter(RollupChange.id <= watermark).delete(synchronize_session=False)
+    db.session.commit()
+    return len(cells)
+
+@app.cli.command("rollup-requests")
+@click.option("--full", is_flag=True, help="Recount every day, needed once for requests made before the rollups existed.")
+def rollup_requests(full):
+    start = time.perf_counter()
+    if full:
+        db.session.query(RequestRollup).delete(synchronize_session=False)
+        db.session.query(RollupChange).delete(synchronize_session=False)
+        db.session.execute(text("INSERT INTO rollupchange (day, service_id) SELECT date_of_request, service_id FROM servicerequest "
+                                "UNION SELECT date_of_request, service_id FROM archived_service_request"))
+        db.session.commit()
+    cells = update_rollups()
+    click.echo(str(cells) + " days of services recounted in " + ("%.2f" % (time.perf_counter() - start)) + "s")
+
+# Value below which q percent of the counted values fall
+def histogram_percentile(values, counts, q):
+    values = np.asarray(values, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    if counts.sum() == 0:
+        return None
+    order = np.argsort(values)
+    cumulative = np.cumsum(counts[order]) / counts.sum()
+    return float(values[order][np.searchsorted(cumulative, q / 100)])
+
+# Status totals and the daily series of the last ROLLUP_DAYS days, of one service or of all
+def rollup_summary(service_id=None):
+    # Small batches of changes are counted right away, bigger ones are left to `flask rollup-requests`
+    update_rollups(limit=app.config['ROLLUP_INLINE_CHANGES'])
+    days = app.config['ROLLUP_DAYS']
+    first_day = date.today() - timedelta(days=days - 1)
+    criteria = [RequestRollup.service_id == service_id] if service_id != None else []
+    statuses = dict(db.session.query(RequestRollup.status, db.func.sum(RequestRollup.requests)).filter(*criteria).group_by(RequestRollup.status).all())
+
+    # Summed per day by SQLite, so a year is a few hundred rows however many services there are
+    requests = np.zeros(days)
+    ratings = np.zeros((days, 5))
+    in_range = [RequestRollup.day >= first_day, RequestRollup.day <= date.today(), *criteria]
+    for day, count in db.session.query(RequestRollup.day, db.func.sum(RequestRollup.requests)).filter(*in_range).group_by(RequestRollup.day):
+        requests[(day - first_day).days] = count
+    rating_sums = [db.func.sum(db.func.json_extract(RequestRollup.rating_counts, "$[" + str(i) + "]")) for i in range(5)]
+    for day, *counts in db.session.query(RequestRollup.day, *rating_sums).filter(RequestRollup.status == "Closed", *in_range).group_by(RequestRollup.day):
+        ratings[(day - first_day).days] = counts
+    completed = db.func.json_each(RequestRollup.completion_days).table_valued("key", "value")
+    completion = dict(db.session.query(db.cast(completed.c.key, db.Integer), db.func.sum(completed.c.value))
+                      .select_from(RequestRollup).join(completed, db.true()).filter(RequestRollup.status == "Closed", *in_range).group_by(completed.c.key).all())
+
+    x = np.arange(days)
+    weekly = np.convolve(requests, np.ones(7) / 7)[:days]
+    rated = ratings.sum(axis=1)
+    average_rating = np.divide(ratings @ np.arange(1, 6), rated, out=np.full(days, np.nan), where=rated > 0)
+    rating_trend = None
+    if np.count_nonzero(rated) > 1:
+        # Change of the average rating over 30 days, days with more ratings count more
+        rating_trend = float(np.polyfit(x[rated > 0], average_rating[rated > 0], 1, w=np.sqrt(rated[rated > 0]))[0] * 30)
+    rating_totals = ratings.sum(axis=0)
+    return {
+        "statuses": statuses,
+        "days": [(first_day + timedelta(days=i)).isoformat() for i in range(days)],
+        "requests": requests.astype(int).tolist(),
+        "weekly_average": np.round(weekly, 2).tolist(),
+        # Change of the requests per day over 30 days
+        "request_trend": float(np.polyfit(x, requests, 1)[0] * 30) if requests.any() else 0.0,
+        "average_rating": [None if np.isnan(value) else round(float(value), 2) for value in average_rating],
+        "rating_trend": rating_trend,
+        "rating_p50": histogram_percentile(np.arange(1, 6), rating_totals, 50),
+        "rating_p90": histogram_percentile(np.arange(1, 6), rating_totals, 90),
+        "completion_p50": histogram_percentile(list(completion), list(completion.values()), 50),
+        "completion_p90": histogram_percentile(list(completion), list(completion.values()), 90),
+    }
+
+# Request Archive
+# Requests are copied to the archive and deleted in batches of ARCHIVE_BATCH_SIZE, each in its own
+# short transaction, so the database is never locked for long and no ORM objects are loaded
+
+# Moves the requests matching the criteria within the current transaction, returns how many
+def move_to_archive(*criteria):
+    columns = [column.name for column in ServiceRequest.__table__.columns]
+    db.session.execute(insert(ArchivedServiceRequest).from_select(columns, db.select(*[ServiceRequest.__table__.c[name] for name in columns]).where(*criteria)))
+    return db.session.execute(delete(ServiceRequest).where(*criteria).execution_options(synchronize_session=False)).rowcount
+
+def archive_requests(*criteria, batch_size=None):
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    archived = 0
+    while True:
+        ids = [row[0] for row in db.session.query(ServiceRequest.id).filter(*criteria).order_by(ServiceRequest.id).limit(batch_size)]
+        if not ids:
+            return archived
+        archived += move_to_archive(ServiceRequest.id.in_(ids))
+        db.session.commit()
+
+@app.cli.command("archive-requests")
+@click.option("--days", default=None, type=int, help="Archive closed and rejected requests older than this, ARCHIVE_AFTER_DAYS by default.")
+@click.option("--batch-size", default=None, type=int, help="Requests moved per transaction, ARCHIVE_BATCH_SIZE by default.")
+def archive_old_requests(days, batch_size):
+    start = time.perf_counter()
+    cutoff = date.today() - timedelta(days=days if days != None else app.config['ARCHIVE_AFTER_DAYS'])
+    archived = archive_requests(ServiceRequest.service_status.in_(["Closed", "Rejected"]),
+                                db.func.coalesce(ServiceRequest.date_of_completion, ServiceRequest.date_of_request) < cutoff, batch_size=batch_size)
+    click.echo(str(archived) + " requests from before " + cutoff.isoformat() + " archived in " + ("%.2f" % (time.perf_counter() - start)) + "s")
+
+# Shared Queries
+
+# One joined SELECT giving (request, customer, service_name, professional) rows,
+# instead of three extra lookups for every request on the page
+def service_request_rows(*criteria):
+    return db.session.query(ServiceRequest, Customer, Services.name, ServiceProfessional)\
+        .outerjoin(Customer, ServiceRequest.customer_id == Customer.cust_id)\
+        .outerjoin(Services, ServiceRequest.service_id == Services.serv_id)\
+        .outerjoin(ServiceProfessional, ServiceRequest.professional_id == ServiceProfessional.pro_id)\
+        .filter(*criteria)\
+        .order_by(ServiceRequest.id)
+
+# Keyset Pagination
+
+class Page:
+    def __init__(self, rows, next_url, prev_url):
+        self.rows = rows
+        self.next_url = next_url
+        self.prev_url = prev_url
+
+def page_url(prefix, direction, cursor):
+    args = {k: v for k, v in request.values.items() if k not in [prefix + "after", prefix + "before"]}
+    args[prefix + direction] = json.dumps(cursor)
+    return url_for(request.endpoint, **request.view_args, **args)
+
+# Rows of query after (or before) the cursor in the order of keys, seeks through the index instead of using OFFSET.
+# The cursor holds the key values of the last (or first) row shown, prefix tells apart several lists on one page.
+def keyset_page(query, keys, descending=False, prefix=""):
+    per_page = max(1, min(request.args.get("per_page", app.config['PAGE_SIZE'], type=int), app.config['MAX_PAGE_SIZE']))
+    after = request.args.get(prefix + "after")
+    before = request.args.get(prefix + "before")
+    forward = before == None
+    try:
+        cursor = json.loads(after if forward else before) if (after or before) else None
+    except ValueError:
+        cursor = None
+    # Cursors come from the query string, anything but a list of plain values is ignored
+    if not isinstance(cursor, list) or len(cursor) != len(keys) \
+            or not all(isinstance(value, (int, float, str)) and not isinstance(value, bool) for value in cursor):
+        cursor = None
+
+    # Walking backwards flips both the comparison and the order
+    ascending = forward != descending
+    if cursor != None:
+        key = tuple_(*keys) if len(keys) > 1 else keys[0]
+        value = tuple_(*cursor) if len(keys) > 1 else cursor[0]
+        query = query.filter(key > value if ascending else key < value)
+    query = query.order_by(None).order_by(*[k.asc() if ascending else k.desc() for k in keys])
+    rows = query.add_columns(*keys).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    has_next = more if forward else True
+    has_prev = cursor != None if forward else more
+
+    n = len(keys)
+    next_url = page_url(prefix, "after", list(rows[-1][-n:])) if has_next and rows else None
+    prev_url = page_url(prefix, "before", list(rows[0][-n:])) if has_prev and rows else None
+    rows = [row[0] if len(row) - n == 1 else tuple(row[:-n]) for row in rows]
+    return Page(rows, next_url, prev_url)
+
+# Number of requests per status in one GROUP BY, statuses without requests are left out
+def status_counts(*criteria):
+    return dict(db.session.query(ServiceRequest.service_status, db.func.count()).filter(*criteria).group_by(ServiceRequest.service_status).all())
+
+# Every search term is matched as a prefix within the given index columns
+def search_match_query(columns, search_input):
+    terms = ['"' + term.replace('"', '""') + '"*' for term in search_input.split()]
+    if len(terms) == 0:
+        return None
+    return "{" + " ".join(columns) + "} : (" + " ".join(terms) + ")"
+
+# (entity_id, rank) rows of one kind matching the search, best matches have the lowest rank
+def search_matches(kind, columns, search_input):
+    match_query = search_match_query(columns, search_input)
+    if match_query == None:
+        return None
+    return text("SELECT rowid / 3 AS entity_id, rank FROM search_index WHERE search_index MATCH :match_query AND rowid % 3 = :kind")\
+        .bindparams(match_query=match_query, kind=kind)\
+        .columns(entity_id=db.Integer, rank=db.Float)\
+        .subquery()
+
+# Criteria restricting key to the ids matching the search, no criteria for an empty search
+def search_criteria(key, kind, columns, search_input):
+    matches = search_matches(kind, columns, search_input)
+    if matches == None:
+        return []
+    return [key.in_(db.select(matches.c.entity_id))]
+
+# (professional, service) rows of approved professionals, ranked by relevance when matches are given
+def professional_rows(*criteria, matches=None, match_key=None):
+    query = db.session.query(ServiceProfessional, Services)\
+        .join(Services, Services.name == ServiceProfessional.service_type)\
+        .filter(ServiceProfessional.approval_status == "Approved", *criteria)
+    if matches != None:
+        return query.join(matches, matches.c.entity_id == match_key).order_by(matches.c.rank)
+    return query.order_by(ServiceProfessional.pro_id)
+
 # Routes
 
 ## Home
@@ -103,6 +1494,52 @@ def before_request():
 def home():
     return render_template("home.html")
 
+# Password Hashing
+# hashlib releases the GIL while hashing, so a small thread pool bounds how many CPUs
+# a burst of logins can take while the other request threads keep running
+
+password_hash_pool = None
+password_hash_pool_lock = threading.Lock()
+password_hash_prefixes = {}
+
+def run_password_hashing(function, *args):
+    global password_hash_pool
+    if app.config['PASSWORD_HASH_WORKERS'] == 0:
+        return function(*args)
+    if password_hash_pool == None:
+        with password_hash_pool_lock:
+            if password_hash_pool == None:
+                password_hash_pool = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'], thread_name_prefix="password-hash")
+    return password_hash_pool.submit(function, *args).result()
+
+def hash_password(password):
+    return run_password_hashing(partial(generate_password_hash, method=app.config['PASSWORD_HASH_METHOD']), password)
+
+def verify_password(password_hash, password):
+    return run_password_hashing(check_password_hash, password_hash, password)
+
+# A hash needs replacing when it was made with another method or cost than the configured one
+def password_needs_rehash(password_hash):
+    method = app.config['PASSWORD_HASH_METHOD']
+    if method not in password_hash_prefixes:
+        password_hash_prefixes[method] = generate_password_hash("", method=method).split("$")[0]
+    return password_hash.split("$")[0] != password_hash_prefixes[method]
+
+@app.cli.command("benchmark-hashing")
+@click.option("--method", "methods", multiple=True, help="Hash method to measure, can be repeated.")
+@click.option("--seconds", default=3.0, show_default=True, help="Time spent measuring each method.")
+def benchmark_hashing(methods, seconds):
+    methods = methods or [app.config['PASSWORD_HASH_METHOD'], "scrypt:16384:8:1", "pbkdf2:sha256:600000", "pbkdf2:sha256:100000"]
+    for method in methods:
+        password_hash = generate_password_hash("benchmark", method=method)
+        logins = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            check_password_hash(password_hash, "benchmark")
+            logins += 1
+        elapsed = time.perf_counter() - start
+        click.echo(method + ": " + ("%.1f" % (logins / elapsed)) + " logins/s per core")
+
 ## Login Pages for Customers and Service Professionals
 
 @app.route("/login/employee", methods=["GET", "POST"])
@@ -111,6 +1548,7 @@ def employee_login():
         if request.form["username"] == "admin" and request.form["password"] == "admin":
             session["user_id"] = "admin"
             session["user_username"] = "admin"
+            session["user_role"] = "admin"
             return redirect(url_for("admin_dashboard"))
         else:
             user_name = request.form["username"]
@@ -120,10 +1558,14 @@ def employee_login():
                 flash("Username does not exist","error")
                 return render_template("employee_login.html")
             else:
-                if check_password_hash(employee.password, password):
+                if verify_password(employee.password, password):
+                    if password_needs_rehash(employee.password):
+                        employee.password = hash_password(password)
+                        db.session.commit()
                     if employee.approval_status == "Approved":
                         session["user_id"] = employee.pro_id
                         session["user_username"] = employee.user_name
+                        session["user_role"] = "professional"
                         return redirect(url_for("professional_dashboard"))
                     elif employee.approval_status == "Blocked":
                         flash("Your account is blocked, please contact administrator","error")
@@ -144,6 +1586,7 @@ def customer_login():
         if request.form["username"] == "admin" and request.form["password"] == "admin":
             session["user_id"] = "admin"
             session["user_username"] = "admin"
+            session["user_role"] = "admin"
             return redirect(url_for("admin_dashboard"))
         else:
             user_name = request.form["username"]
@@ -153,9 +1596,13 @@ def customer_login():
                 flash("Username does not exist","error")
                 return render_template("customer_login.html")
             else:
-                if check_password_hash(customer.password, password):
+                if verify_password(customer.password, password):
+                    if password_needs_rehash(customer.password):
+                        customer.password = hash_password(password)
+                        db.session.commit()
                     session["user_id"] = customer.cust_id
                     session["user_username"] = customer.user_name
+                    session["user_role"] = "customer"
                     return redirect(url_for("customer_dashboard"))
                 else:
                     flash("Incorrect password","error")
@@ -168,14 +1615,61 @@ ALLOWED_EXTENSIONS = ['pdf']
 def allowed_extensions(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+RESUME_CHUNK_SIZE = 64 * 1024
+
+# Hashes the upload in chunks from the temporary file Werkzeug spooled it to, then saves it under
+# its SHA-256 so the same file uploaded twice is kept once. Returns (filename, error).
+def save_resume(resume):
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = resume.stream.read(RESUME_CHUNK_SIZE)
+        if not chunk:
+            break
+        if size == 0 and not chunk.startswith(b"%PDF-"):
+            return None, "Only PDF files are allowed"
+        size += len(chunk)
+        if size > app.config['MAX_RESUME_SIZE']:
+            return None, "Resume must not be larger than " + str(app.config['MAX_RESUME_SIZE'] // (1024 * 1024)) + " MB"
+        digest.update(chunk)
+    if size == 0:
+        return None, "Only PDF files are allowed"
+    filename = digest.hexdigest() + ".pdf"
+    path = os.path.join(app.config['UPLOAD_PATH'], filename)
+    if not os.path.exists(path):
+        os.makedirs(app.config['UPLOAD_PATH'], exist_ok=True)
+        # Saved next to its final name and renamed, so a half written file is never served
+        fd, temp_path = tempfile.mkstemp(dir=app.config['UPLOAD_PATH'], suffix=".part")
+        os.close(fd)
+        try:
+            resume.stream.seek(0)
+            resume.save(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return filename, None
+
+@app.errorhandler(413)
+def request_too_large(error):
+    flash("Resume must not be larger than " + str(app.config['MAX_RESUME_SIZE'] // (1024 * 1024)) + " MB","error")
+    return redirect(request.url)
+
+# A request changed by someone else between reading and saving it
+@app.errorhandler(StaleDataError)
+def request_changed(error):
+    db.session.rollback()
+    flash("This request was changed in the meantime, please try again","error")
+    return redirect(request.referrer or url_for("home"))
+
 ## Register Pages for Customers and Service Professionals
 
 @app.route("/register/employee", methods=["GET", "POST"])
 def employee_register():
-    services = Services.query.all()
+    services = service_catalog()
     if request.method == "POST":
         user_name = request.form["username"]
-        password = generate_password_hash(request.form["password"])
+        password = hash_password(request.form["password"])
         first_name = request.form["first_name"]
         last_name = request.form["last_name"]
         experience = request.form["work_exp"]
@@ -189,12 +1683,15 @@ def employee_register():
             flash("Username already exists","error")
             return render_template("employee_register.html", services=services)
         else:
-            if resume != "" and allowed_extensions(resume.filename):
-                resume.save(os.path.join(app.config['UPLOAD_PATH'], user_name+"_resume.pdf"))
+            if resume.filename != "" and allowed_extensions(resume.filename):
+                resume_name, error = save_resume(resume)
+                if error != None:
+                    flash(error,"error")
+                    return render_template("employee_register.html", services=services)
             else:
                 flash("Only PDF files are allowed","error")
                 return render_template("employee_register.html", services=services)
-            new_employee = ServiceProfessional(user_name=user_name, password=password, first_name=first_name, last_name=last_name, service_type=service_name, description=service_description, experience=experience,resume=user_name+"_resume.pdf",contact=contact,pincode=pincode)
+            new_employee = ServiceProfessional(user_name=user_name, password=password, first_name=first_name, last_name=last_name, service_type=service_name, description=service_description, experience=experience,resume=resume_name,contact=contact,pincode=pincode)
             db.session.add(new_employee)
             db.session.commit()
             flash("Account created successfully","success")
@@ -206,7 +1703,7 @@ def employee_register():
 def customer_register():
     if request.method == "POST":
         user_name = request.form["username"]
-        password = generate_password_hash(request.form["password"])
+        password = hash_password(request.form["password"])
         first_name = request.form["first_name"]
         last_name = request.form["last_name"]
         address = request.form["address"]
@@ -227,550 +1724,904 @@ def customer_register():
 ## Dashboard for Admin
 
 @app.route("/admin/dashboard")
+@admin_required
 def admin_dashboard():
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        
-        # Handled Services Here
-        services = Services.query.all()
-        service_list = []
-        sub_list = []
-        count = 0
-        for s in range(len(services)):
-            if count != 5:
-                sub_list.append(services[s])
-                count += 1
-            elif count == 5:
-                service_list.append(sub_list)
-                sub_list = []
-                count = 0
-                sub_list.append(services[s])
-                count += 1
-            if s == len(services) - 1 and count != 0:
-                service_list.append(sub_list)
-        
-        # Handled Service Professionals Here according to ratings
-        service_professionals = ServiceProfessional.query.order_by(ServiceProfessional.avg_rating.desc()).all()
-
-        # Handled Service Requests Here
-        all_requests = ServiceRequest.query.all()
-        service_requests = []
-        for req in all_requests:
-            service_requests.append((req, ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()))
-
-        return render_template("admin_dashboard_home.html", service_list=service_list, service_professionals=service_professionals, service_requests = service_requests)
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    
+    # Handled Services Here
+    service_list = service_grid()
+    
+    # Handled Service Professionals Here according to ratings
+    pro_page = keyset_page(ServiceProfessional.query, [ServiceProfessional.avg_rating, ServiceProfessional.pro_id], descending=True, prefix="pro_")
+
+    # Handled Service Requests Here
+    request_page = keyset_page(service_request_rows(), [ServiceRequest.id])
+    service_requests = [(req, professional) for req, customer, service_name, professional in request_page.rows]
+
+    return render_template("admin_dashboard_home.html", service_list=service_list, service_professionals=pro_page.rows, service_requests = service_requests, pro_page=pro_page, request_page=request_page)
 
 # CRUD for Services
 
 # Creating a Service
 @app.route("/admin/create/service", methods=["GET", "POST"])
+@admin_required
 def create_service():
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        if request.method == "POST":
-            service_name = request.form["service_name"]
-            service_rate = request.form["service_rate"]
-            time_required = request.form["time_required"]
-            service_description = request.form["service_description"]
+    if request.method == "POST":
+        service_name = request.form["service_name"]
+        service_rate = request.form["service_rate"]
+        time_required = request.form["time_required"]
+        service_description = request.form["service_description"]
 
-            if Services.query.filter_by(name=service_name).first() != None:
-                flash("Service already exists","error")
-                return render_template("create_service.html")
-            else:
-                new_service = Services(name=service_name, price=service_rate, time_required=time_required, description=service_description)
-                db.session.add(new_service)
-                db.session.commit()
-                flash("Service created successfully","success")
-                return redirect(url_for("admin_dashboard"))
-        return render_template("create_service.html")
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+        if Services.query.filter_by(name=service_name).first() != None:
+            flash("Service already exists","error")
+            return render_template("create_service.html")
+        else:
+            new_service = Services(name=service_name, price=service_rate, time_required=time_required, description=service_description)
+            db.session.add(new_service)
+            db.session.commit()
+            invalidate_service_catalog()
+            flash("Service created successfully","success")
+            return redirect(url_for("admin_dashboard"))
+    return render_template("create_service.html")
 
 # Updating a Service
 @app.route("/admin/edit/service/<int:service_id>", methods=["GET", "POST"])
+@admin_required
 def edit_service(service_id):
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        service = Services.query.filter_by(serv_id=service_id).first()
-        if request.method == "POST":
-            service_name = request.form["service_name"]
-            service_rate = request.form["service_rate"]
-            time_required = request.form["time_required"]
-            service_description = request.form["service_description"]
-            if service_name != service.name:
-                if Services.query.filter_by(name=service_name).first() != None:
-                    flash("Service already exists","error")
-                    return render_template("edit_service.html", service = service)
-                else:
-                    service.name = service_name
-                service.price = service_rate
-                service.time_required = time_required
-                service.description = service_description
+    service = Services.query.filter_by(serv_id=service_id).first()
+    if request.method == "POST":
+        service_name = request.form["service_name"]
+        service_rate = request.form["service_rate"]
+        time_required = request.form["time_required"]
+        service_description = request.form["service_description"]
+        if service_name != service.name:
+            if Services.query.filter_by(name=service_name).first() != None:
+                flash("Service already exists","error")
+                return render_template("edit_service.html", service = service)
             else:
-                service.price = service_rate
-                service.time_required = time_required
-                service.description = service_description
-            db.session.commit()
-            flash("Service updated successfully","success")
-            return redirect(url_for("admin_dashboard"))
-        return render_template("edit_service.html", service = service)
+                service.name = service_name
+            service.price = service_rate
+            service.time_required = time_required
+            service.description = service_description
+        else:
+            service.price = service_rate
+            service.time_required = time_required
+            service.description = service_description
+        db.session.commit()
+        invalidate_service_catalog()
+        reset_match_index()
+        flash("Service updated successfully","success")
+        return redirect(url_for("admin_dashboard"))
+    return render_template("edit_service.html", service = service)
 
 # Deleting a Service
 @app.route("/admin/delete/service/<int:service_id>")
+@admin_required
 def delete_service(service_id):
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        service = Services.query.filter_by(serv_id=service_id).first()
-        db.session.delete(service)
-        db.session.commit()
-        flash("Service deleted successfully","success")
-        return redirect(url_for("admin_dashboard"))
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    service = Services.query.filter_by(serv_id=service_id).first()
+    # Requests of the service and of its professionals go to the archive in batches,
+    # then the professionals and the service are deleted with one statement each
+    professional_ids = [row[0] for row in db.session.query(ServiceProfessional.pro_id).filter_by(service_type=service.name)]
+    archive_requests(ServiceRequest.service_id == service_id)
+    archive_requests(ServiceRequest.professional_id.in_(db.select(ServiceProfessional.pro_id).filter_by(service_type=service.name)))
+    ServiceProfessional.query.filter_by(service_type=service.name).delete(synchronize_session=False)
+    Services.query.filter_by(serv_id=service_id).delete(synchronize_session=False)
+    db.session.commit()
+    invalidate_service_catalog()
+    reset_match_index()
+    for professional_id in professional_ids:
+        forget_identity("professional", professional_id)
+    flash("Service deleted successfully","success")
+    return redirect(url_for("admin_dashboard"))
 
 # Approval of Professionals
 
 @app.route("/admin/approve/professional/<int:professional_id>")
+@admin_required
 def approve_professional(professional_id):
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
-        professional.approval_status = "Approved"
-        service = Services.query.filter_by(name=professional.service_type).first()
-        service.professionals.append(professional)
-        db.session.commit()
-        flash("Professional approved successfully","success")
-        return redirect(url_for("admin_dashboard"))
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
+    professional.approval_status = "Approved"
+    service = Services.query.filter_by(name=professional.service_type).first()
+    service.professionals.append(professional)
+    db.session.commit()
+    forget_identity("professional", professional_id)
+    update_match_index(professional)
+    flash("Professional approved successfully","success")
+    return redirect(url_for("admin_dashboard"))
+
+# Resume of a Professional, with conditional and range requests
+
+@app.route("/admin/resume/<int:professional_id>")
+@admin_required
+def professional_resume(professional_id):
+    professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
+    if professional == None or professional.resume == None:
+        abort(404)
+    if app.config['RESUME_ACCEL_REDIRECT'] != None:
+        return Response(headers={"X-Accel-Redirect": app.config['RESUME_ACCEL_REDIRECT'] + professional.resume, "Content-Type": "application/pdf"})
+    return send_from_directory(app.config['UPLOAD_PATH'], professional.resume, mimetype="application/pdf", max_age=86400)
 
 # Rejection and Removal of Professionals
 
 @app.route("/admin/reject/professional/<int:professional_id>")
+@admin_required
 def reject_professional(professional_id):
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
-        db.session.delete(professional)
-        db.session.commit()
-        flash("Professional rejected and deleted successfully","success")
-        return redirect(url_for("admin_dashboard"))
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    archive_requests(ServiceRequest.professional_id == professional_id)
+    ServiceProfessional.query.filter_by(pro_id=professional_id).delete(synchronize_session=False)
+    db.session.commit()
+    forget_identity("professional", professional_id)
+    remove_from_match(professional_id)
+    flash("Professional rejected and deleted successfully","success")
+    return redirect(url_for("admin_dashboard"))
 
 # Blocking Professionals
 
 @app.route("/admin/block/professional/<int:professional_id>")
+@admin_required
 def block_professional(professional_id):
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
-        professional.approval_status="Blocked"
-        db.session.commit()
-        flash("Professional blocked successfully","success")
-        return redirect(url_for("admin_dashboard"))
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
+    professional.approval_status="Blocked"
+    db.session.commit()
+    forget_identity("professional", professional_id)
+    update_match_index(professional)
+    flash("Professional blocked successfully","success")
+    return redirect(url_for("admin_dashboard"))
 
 # Unblocking Professionals
 
 @app.route("/admin/unblock/professional/<int:professional_id>")
+@admin_required
 def unblock_professional(professional_id):
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
-        professional.approval_status="Approved"
-        db.session.commit()
-        flash("Professional unblocked successfully","success")
-        return redirect(url_for("admin_dashboard"))
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    professional = ServiceProfessional.query.filter_by(pro_id=professional_id).first()
+    professional.approval_status="Approved"
+    db.session.commit()
+    forget_identity("professional", professional_id)
+    update_match_index(professional)
+    flash("Professional unblocked successfully","success")
+    return redirect(url_for("admin_dashboard"))
+
+# Batch Moderation of Professionals
+# POST {"action": "approve", "ids": [1, 2, 3]} applies one action to many professionals with
+# set-based statements in one transaction, and answers with the result for every id
+
+MODERATION_ACTIONS = {
+    # action: (statuses it applies to, new status or None to delete, result)
+    "approve": (["Pending"], "Approved", "approved"),
+    "block": (["Approved"], "Blocked", "blocked"),
+    "unblock": (["Blocked"], "Approved", "unblocked"),
+    "reject": (["Pending", "Approved", "Blocked"], None, "deleted"),
+}
+# Ids per IN (...) list, well below the number of parameters SQLite accepts
+MODERATION_CHUNK_SIZE = 500
+
+@app.route("/admin/professionals/moderate", methods=["POST"])
+@admin_required
+def moderate_professionals():
+    data = request.get_json(silent=True) or {}
+    action = data.get("action")
+    ids = data.get("ids")
+    if action not in MODERATION_ACTIONS or not isinstance(ids, list) or not all(type(pro_id) == int for pro_id in ids):
+        return jsonify({"error": "Send {\"action\": \"approve\", \"block\", \"unblock\" or \"reject\", \"ids\": [professional ids]}"}), 400
+    if len(ids) > app.config['MODERATION_MAX_IDS']:
+        return jsonify({"error": "At most " + str(app.config['MODERATION_MAX_IDS']) + " ids per batch"}), 400
+    statuses, new_status, done = MODERATION_ACTIONS[action]
+    ids = list(dict.fromkeys(ids))
+    chunks = [ids[start:start + MODERATION_CHUNK_SIZE] for start in range(0, len(ids), MODERATION_CHUNK_SIZE)]
+
+    # Current status of every id, and whether the service of the professional still exists
+    found = {}
+    for chunk in chunks:
+        rows = db.session.query(ServiceProfessional.pro_id, ServiceProfessional.approval_status, ServiceProfessional.service_type, ServiceProfessional.pincode, Services.serv_id)\
+            .outerjoin(Services, Services.name == ServiceProfessional.service_type)\
+            .filter(ServiceProfessional.pro_id.in_(chunk))
+        found.update((row.pro_id, row) for row in rows)
+
+    eligible = [pro_id for pro_id in ids if pro_id in found and found[pro_id].approval_status in statuses
+                and (new_status != "Approved" or found[pro_id].serv_id != None)]
+    # The status is checked again by the statements, so professionals changed meanwhile are left alone
+    changed = set()
+    for start in range(0, len(eligible), MODERATION_CHUNK_SIZE):
+        chunk = eligible[start:start + MODERATION_CHUNK_SIZE]
+        criteria = [ServiceProfessional.pro_id.in_(chunk), ServiceProfessional.approval_status.in_(statuses)]
+        if new_status == None:
+            deleted = db.session.execute(delete(ServiceProfessional).where(*criteria).returning(ServiceProfessional.pro_id)
+                                         .execution_options(synchronize_session=False)).scalars().all()
+            if deleted:
+                move_to_archive(ServiceRequest.professional_id.in_(deleted))
+            changed.update(deleted)
+        else:
+            # Professionals belong to Services.professionals through service_type, checked above to name
+            # an existing service, so approving them attaches them to it without further statements
+            changed.update(db.session.execute(update(ServiceProfessional).where(*criteria).values(approval_status=new_status)
+                                              .returning(ServiceProfessional.pro_id).execution_options(synchronize_session=False)).scalars())
+    db.session.commit()
+
+    results = []
+    for pro_id in ids:
+        row = found.get(pro_id)
+        if row == None:
+            results.append({"id": pro_id, "result": "not_found"})
+        elif pro_id in changed:
+            results.append({"id": pro_id, "result": done})
+            forget_identity("professional", pro_id)
+            if new_status == None:
+                remove_from_match(pro_id)
+            else:
+                update_match_index(SimpleNamespace(pro_id=pro_id, service_type=row.service_type, pincode=row.pincode, approval_status=new_status))
+        elif row.approval_status in statuses and new_status == "Approved" and row.serv_id == None:
+            results.append({"id": pro_id, "result": "unknown_service"})
+        else:
+            results.append({"id": pro_id, "result": "invalid_status", "status": row.approval_status})
+    return jsonify({"action": action, "changed": len(changed), "results": results})
+
+# Criteria of the admin request search filters, None when the date filter cannot be parsed
+
+def admin_search_criteria(filter, search_input, date_from, date_to):
+    criteria = []
+    if filter == "service_name":
+        criteria = search_criteria(Services.serv_id, SEARCH_SERVICE, ["name"], search_input)
+    elif filter == "date_of_req":
+        try:
+            if not date_from and not date_to:
+                date_from = date_to = datetime.strptime(search_input.strip(), "%d/%m/%Y").date().strftime("%Y-%m-%d")
+            if date_from:
+                criteria.append(ServiceRequest.date_of_request >= datetime.strptime(date_from, "%Y-%m-%d").date())
+            if date_to:
+                criteria.append(ServiceRequest.date_of_request <= datetime.strptime(date_to, "%Y-%m-%d").date())
+        except ValueError:
+            return None
+    elif filter == "professional_name":
+        criteria = search_criteria(ServiceProfessional.pro_id, SEARCH_PROFESSIONAL, ["first_name", "last_name", "user_name"], search_input)
+    elif filter == "customer_name":
+        criteria = search_criteria(Customer.cust_id, SEARCH_CUSTOMER, ["first_name", "last_name", "user_name"], search_input)
+    return criteria
 
 # Admin Dashboard Search
 
 @app.route("/admin/dashboard/search", methods=["GET", "POST"])
+@admin_required
 def admin_dashboard_search():
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        if request.method == "POST":
-            filter = request.form["filter"]
-            search_input = request.form["search_input"]
-            if filter == "service_name":
-                services = Services.query.filter(Services.name.ilike("%"+search_input+"%")).all()
-                all_req = []
-                for serv in services:
-                    all_req.extend(serv.service_requests)
-                service_requests = []
-                for req in all_req:
-                    service_requests.append((req,Customer.query.filter_by(cust_id=req.customer_id).first(), Services.query.filter_by(serv_id=req.service_id).first().name, ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()))
-                return render_template("admin_dashboard_search.html", service_requests=service_requests, last_input=search_input, filter_search=filter)
-            elif filter == "date_of_req":
-                requests = ServiceRequest.query.filter(ServiceRequest.date_of_request.ilike("%"+search_input+"%")).all()
-                service_requests = []
-                for req in requests:
-                    service_requests.append((req,Customer.query.filter_by(cust_id=req.customer_id).first(), Services.query.filter_by(serv_id=req.service_id).first().name, ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()))
-                return render_template("admin_dashboard_search.html", service_requests=service_requests, last_input=search_input, filter_search=filter)
-            elif filter == "professional_name":
-                professional_first_name = ServiceProfessional.query.filter(ServiceProfessional.first_name.ilike("%"+search_input+"%")).all()
-                professional_last_name = ServiceProfessional.query.filter(ServiceProfessional.last_name.ilike("%"+search_input+"%")).all()
-                professional_user_name = ServiceProfessional.query.filter(ServiceProfessional.user_name.ilike("%"+search_input+"%")).all()
-                pros = list(set(professional_first_name + professional_last_name + professional_user_name))
-                all_req = []
-                for pro in pros:
-                    all_req.extend(pro.all_requests)
-                service_requests = []
-                for req in all_req:
-                    service_requests.append((req,Customer.query.filter_by(cust_id=req.customer_id).first(), Services.query.filter_by(serv_id=req.service_id).first().name, ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()))
-                return render_template("admin_dashboard_search.html", service_requests=service_requests, last_input=search_input, filter_search=filter)
-            elif filter == "customer_name":
-                customer_first_name = Customer.query.filter(Customer.first_name.ilike("%"+search_input+"%")).all()
-                customer_last_name = Customer.query.filter(Customer.last_name.ilike("%"+search_input+"%")).all()
-                customer_user_name = Customer.query.filter(Customer.user_name.ilike("%"+search_input+"%")).all()
-                customers = list(set(customer_first_name + customer_last_name + customer_user_name))
-                all_req = []
-                for customer in customers:
-                    all_req.extend(customer.service_request)
-                service_requests = []
-                for req in all_req:
-                    service_requests.append((req, Customer.query.filter_by(cust_id=req.customer_id).first(), Services.query.filter_by(serv_id=req.service_id).first().name, ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()))
-                return render_template("admin_dashboard_search.html", service_requests=service_requests, last_input=search_input, filter_search=filter)
-        all_req = ServiceRequest.query.all()
-        service_requests = []
-        for req in all_req:
-            service_requests.append((req, Customer.query.filter_by(cust_id=req.customer_id).first(), Services.query.filter_by(serv_id=req.service_id).first().name, ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()))
-        return render_template("admin_dashboard_search.html", service_requests=service_requests)
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    # Filters come from the search form or from the query string of the page links
+    filter = request.values.get("filter")
+    search_input = request.values.get("search_input", "")
+    date_from = request.values.get("date_from")
+    date_to = request.values.get("date_to")
+    criteria = admin_search_criteria(filter, search_input, date_from, date_to)
+    if criteria == None:
+        flash("Enter the date as dd/mm/yyyy or pick a date range","error")
+        return redirect(url_for("admin_dashboard_search"))
+    page = keyset_page(service_request_rows(*criteria), [ServiceRequest.id])
+    return render_template("admin_dashboard_search.html", service_requests=page.rows, page=page, last_input=search_input, filter_search=filter, date_from=date_from, date_to=date_to)
+
+# Export of the searched requests as CSV or JSONL, streamed from a server-side cursor
+
+EXPORT_COLUMNS = ["request_id", "service", "customer_username", "customer_name", "professional_username", "professional_name", "date_of_request", "date_of_completion", "status", "rating", "remarks"]
+EXPORT_BATCH_SIZE = 1000
+
+def export_record(req, customer, service_name, professional):
+    return [
+        req.id,
+        service_name,
+        customer.user_name if customer != None else None,
+        " ".join(filter(None, [customer.first_name, customer.last_name])) if customer != None else None,
+        professional.user_name if professional != None else None,
+        " ".join(filter(None, [professional.first_name, professional.last_name])) if professional != None else None,
+        req.date_of_request.isoformat() if req.date_of_request != None else None,
+        req.date_of_completion.isoformat() if req.date_of_completion != None else None,
+        req.service_status,
+        req.ratings,
+        req.remarks,
+    ]
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(export_record(*row))
+        if buffer.tell() > 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_jsonl(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, export_record(*row)))) + "\n"
+
+@app.route("/admin/dashboard/search/export")
+@admin_required
+def admin_dashboard_export():
+    criteria = admin_search_criteria(request.args.get("filter"), request.args.get("search_input", ""), request.args.get("date_from"), request.args.get("date_to"))
+    if criteria == None:
+        flash("Enter the date as dd/mm/yyyy or pick a date range","error")
+        return redirect(url_for("admin_dashboard_search"))
+    rows = service_request_rows(*criteria).yield_per(EXPORT_BATCH_SIZE)
+    if request.args.get("format") == "jsonl":
+        return Response(stream_with_context(export_jsonl(rows)), mimetype="application/x-ndjson",
+                        headers={"Content-Disposition": "attachment; filename=service_requests.jsonl"})
+    return Response(stream_with_context(export_csv(rows)), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=service_requests.csv"})
 
 # Summary of Admin Dashboard
 
 @app.route("/admin/dashboard/summary")
+@admin_required
 def admin_dashboard_summary():
-    if session['user_id'] == "admin" and session['user_username'] == "admin":
-        rejected_req = len(ServiceRequest.query.filter_by(service_status="Rejected").all())
-        accepted_req = len(ServiceRequest.query.filter_by(service_status="Accepted").all())
-        pending_req = len(ServiceRequest.query.filter_by(service_status="Requested").all())
-        closed_req = len(ServiceRequest.query.filter_by(service_status="Closed").all())
-        x = ['Rejected', 'Accepted', 'Pending', 'Closed']
-        y = [rejected_req, accepted_req, pending_req, closed_req]
-        return render_template("admin_dashboard_summary.html", x=x, y=y)
-    else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+    summary = rollup_summary()
+    counts = summary["statuses"]
+    x = ['Rejected', 'Accepted', 'Pending', 'Closed', 'Expired']
+    y = [counts.get("Rejected", 0), counts.get("Accepted", 0), counts.get("Requested", 0), counts.get("Closed", 0), counts.get("Expired", 0)]
+    return render_template("admin_dashboard_summary.html", x=x, y=y, summary=summary)
 
 ## Professional Dashboard
 
 @app.route("/professional/dashboard")
+@professional_required
 def professional_dashboard():
-    if ServiceProfessional.query.filter_by(pro_id=session['user_id'], approval_status = "Approved").first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        professional = ServiceProfessional.query.filter_by(pro_id=session['user_id']).first()
-        public_requests = ServiceRequest.query.filter_by(professional_id=None, service_id=Services.query.filter_by(name=professional.service_type).first().serv_id, service_status="Requested").all() 
-        private_requests = ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Requested").all()
-        accepted_requests = ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Accepted").all()
-        closed_requests = ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Closed").all()
-
-        mod_pub_req = []
-        mod_pri_req = []
-        mod_acp_req = []
-        mod_clo_req = []
-
-        for req in public_requests:
-            mod_pub_req.append((req, Customer.query.filter_by(cust_id=req.customer_id).first()))
-        for req in private_requests:
-            mod_pri_req.append((req, Customer.query.filter_by(cust_id=req.customer_id).first()))
-        for req in accepted_requests:
-            mod_acp_req.append((req, Customer.query.filter_by(cust_id=req.customer_id).first()))
-        for req in closed_requests:
-            mod_clo_req.append((req, Customer.query.filter_by(cust_id=req.customer_id).first()))
-        
-        return render_template("professional_dashboard_home.html", public_requests=mod_pub_req, private_requests=mod_pri_req, accepted_requests=mod_acp_req, closed_requests=mod_clo_req)
+    professional = current_professional()
+    service_id = next((service.serv_id for service in service_catalog() if service.name == professional.service_type), None)
+    if service_id == None:
+        # The cached catalog can miss a service created moments ago by another worker
+        service_id = db.session.query(Services.serv_id).filter_by(name=professional.service_type).scalar()
+    if service_id == None:
+        abort(404)
+
+    # Public requests of the service and the professional's own requests by status, each list is
+    # paged on its own with the newest requests first so new work is on the first page
+    sections = {
+        "public": and_(ServiceRequest.professional_id == None, ServiceRequest.service_id == service_id, ServiceRequest.service_status == "Requested"),
+        "private": and_(ServiceRequest.professional_id == professional.pro_id, ServiceRequest.service_status == "Requested"),
+        "accepted": and_(ServiceRequest.professional_id == professional.pro_id, ServiceRequest.service_status == "Accepted"),
+        "closed": and_(ServiceRequest.professional_id == professional.pro_id, ServiceRequest.service_status == "Closed"),
+    }
+    criteria = or_(*sections.values())
+
+    # Repeat visits with no request created, changed or deleted since get 304 without rendering,
+    # unless there are messages to show
+    version = db.session.query(db.func.count(ServiceRequest.id), db.func.max(ServiceRequest.id), db.func.max(ServiceRequest.updated_at)).filter(criteria).one()
+    etag = hashlib.sha1(repr((professional.pro_id, tuple(version), request.full_path)).encode()).hexdigest()
+    if "_flashes" not in session and etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    inbox = db.session.query(ServiceRequest, Customer)\
+        .outerjoin(Customer, ServiceRequest.customer_id == Customer.cust_id)
+    pages = {name: keyset_page(inbox.filter(section), [ServiceRequest.id], descending=True, prefix=name + "_") for name, section in sections.items()}
+
+    has_messages = "_flashes" in session
+    response = make_response(render_template("professional_dashboard_home.html", public_requests=pages["public"].rows, private_requests=pages["private"].rows,
+                                             accepted_requests=pages["accepted"].rows, closed_requests=pages["closed"].rows, pages=pages))
+    if not has_messages:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 # Accepting Requests
+# Claiming is a single conditional UPDATE, when several professionals accept the same
+# public request at once only the first one matches a row
 
 @app.route("/professional/accept/request/<int:request_id>")
+@professional_required
 def accept_request(request_id):
-    if ServiceProfessional.query.filter_by(pro_id = session["user_id"], approval_status = "Approved").first() != None:
-        pro = ServiceProfessional.query.filter_by(pro_id=session["user_id"]).first()
-        req = ServiceRequest.query.filter_by(id=request_id).first()
-        req.service_status = "Accepted"
-        if req.professional_id == None:
-            req.professional_id = session["user_id"]
-        pro.all_requests.append(req)
-        db.session.commit()
-        flash("Request accepted successfully","success")
+    result = db.session.execute(update(ServiceRequest)
+        .where(ServiceRequest.id == request_id, ServiceRequest.service_status == "Requested",
+               or_(ServiceRequest.professional_id == None, ServiceRequest.professional_id == session["user_id"]))
+        .values(service_status="Accepted", professional_id=session["user_id"], version=ServiceRequest.version + 1))
+    if result.rowcount == 0:
+        db.session.rollback()
+        flash("This request has already been taken","error")
         return redirect(url_for("professional_dashboard"))
-    else:
-        flash("Unauthorised Access","error")    
-        return redirect(url_for("home"))
+    record_request_event("accepted", request_id)
+    db.session.commit()
+    flash("Request accepted successfully","success")
+    return redirect(url_for("professional_dashboard"))
 
 # Rejecting Requests
 
 @app.route("/professional/reject/request/<int:request_id>")
+@professional_required
 def reject_request(request_id):
-    if ServiceProfessional.query.filter_by(pro_id = session["user_id"], approval_status = "Approved").first() != None:
-        pro = ServiceProfessional.query.filter_by(pro_id=session["user_id"]).first()
-        req = ServiceRequest.query.filter_by(id=request_id).first()
-        req.service_status = "Rejected"
-        pro.all_requests.append(req)
-        db.session.commit()
-        flash("Request rejected successfully","success")
+    result = db.session.execute(update(ServiceRequest)
+        .where(ServiceRequest.id == request_id, ServiceRequest.service_status == "Requested",
+               or_(ServiceRequest.professional_id == None, ServiceRequest.professional_id == session["user_id"]))
+        .values(service_status="Rejected", professional_id=session["user_id"], version=ServiceRequest.version + 1))
+    if result.rowcount == 0:
+        db.session.rollback()
+        flash("This request has already been taken","error")
         return redirect(url_for("professional_dashboard"))
-    else:
-        flash("Unauthorised Access","error")    
-        return redirect(url_for("home"))
+    record_request_event("rejected", request_id)
+    db.session.commit()
+    flash("Request rejected successfully","success")
+    return redirect(url_for("professional_dashboard"))
 
 # Professional Dashboard Summary
 
 @app.route("/professional/dashboard/summary")
+@professional_required
 def professional_dashboard_summary():
-    if ServiceProfessional.query.filter_by(pro_id=session['user_id'], approval_status = "Approved").first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        x = ['Rejected', 'Accepted', 'Received', 'Closed']
-        rej_req = len(ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Rejected").all())
-        rec_req = len(ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Requested").all())
-        acc_req = len(ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Accepted").all())
-        clo_req = len(ServiceRequest.query.filter_by(professional_id=session['user_id'], service_status="Closed").all())
-        y = [rej_req, acc_req, rec_req, clo_req]
-        return render_template("professional_dashboard_summary.html", x=x, y=y)
+    x = ['Rejected', 'Accepted', 'Received', 'Closed']
+    counts = status_counts(ServiceRequest.professional_id == session['user_id'])
+    y = [counts.get("Rejected", 0), counts.get("Accepted", 0), counts.get("Requested", 0), counts.get("Closed", 0)]
+    # Requests of the whole service over the last year
+    service_type = current_professional().service_type
+    service_id = next((service.serv_id for service in service_catalog() if service.name == service_type), None)
+    return render_template("professional_dashboard_summary.html", x=x, y=y, summary=rollup_summary(service_id))
 
 ## Customer Dashboard
 
 @app.route("/customer/dashboard")
+@customer_required
 def customer_dashboard():
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        # Handled Servcies here
-        services = Services.query.all()
-        service_list = []
-        sub_list = []
-        count = 0
-        for s in range(len(services)):
-            if count != 5:
-                sub_list.append(services[s])
-                count += 1
-            elif count == 5:
-                service_list.append(sub_list)
-                sub_list = []
-                count = 0
-                sub_list.append(services[s])
-                count += 1
-            if s == len(services) - 1 and count != 0:
-                service_list.append(sub_list)
-        
-        # Handled Requests here
-        requests = ServiceRequest.query.filter_by(customer_id=session['user_id']).all()
-        mod_req_list = []
-
-        for req in requests:
-            service = Services.query.filter_by(serv_id=req.service_id).first()
-            professional = ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()
-            if professional == None:
-                mod_req_list.append(("No Professional Accepted Yet", service.name, req.service_status, "No Contact", req.id, req.date_of_request))
-            else:
-                mod_req_list.append((professional.user_name, professional.service_type, req.service_status, professional.contact, req.id, req.date_of_request))
-        
-        return render_template("customer_dashboard_home.html", service_list=service_list, mod_req_list=mod_req_list)
+    # Handled Servcies here
+    service_list = service_grid()
+    
+    # Handled Requests here
+    mod_req_list = []
+
+    for req, customer, service_name, professional in service_request_rows(ServiceRequest.customer_id == session['user_id']):
+        if professional == None:
+            mod_req_list.append(("No Professional Accepted Yet", service_name, req.service_status, "No Contact", req.id, req.date_of_request))
+        else:
+            mod_req_list.append((professional.user_name, professional.service_type, req.service_status, professional.contact, req.id, req.date_of_request))
+    
+    return render_template("customer_dashboard_home.html", service_list=service_list, mod_req_list=mod_req_list)
 
 # Viewing a service with its professionals
 
 @app.route("/customer/view/service/<int:service_id>")
+@customer_required
 def customer_view_service(service_id):
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        service = Services.query.filter_by(serv_id=service_id).first()
-        pros = ServiceProfessional.query.filter_by(service_type=service.name, approval_status="Approved").order_by(ServiceProfessional.avg_rating.desc()).all()
-        
-        return render_template("customer_dashboard_view_service.html", service=service, pros=pros)
+    service = Services.query.filter_by(serv_id=service_id).first()
+    pros = match_professionals(service.name, current_customer().pin_code)
+    
+    return render_template("customer_dashboard_view_service.html", service=service, pros=pros)
 
 # Creating a public request
 
 @app.route("/customer/create/request/<int:service_id>")
+@customer_required
 def create_public_request(service_id):
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
+    service = Services.query.filter_by(serv_id=service_id).first()
+    if ServiceRequest.query.filter_by(professional_id=None,service_id=service_id, customer_id=session['user_id'], service_status="Requested").first() != None:
+        flash("You already have a request open for this service","error")
+        return redirect(url_for("customer_dashboard"))
     else:
-        service = Services.query.filter_by(serv_id=service_id).first()
-        if ServiceRequest.query.filter_by(professional_id=None,service_id=service_id, customer_id=session['user_id'], service_status="Requested").first() != None:
-            flash("You already have a request open for this service","error")
-            return redirect(url_for("customer_dashboard"))
-        else:
-            new_request = ServiceRequest(service_id=service_id, customer_id=session['user_id'])
-            service.service_requests.append(new_request)
-            customer = Customer.query.filter_by(cust_id=session['user_id']).first()
-            customer.service_request.append(new_request)
-            db.session.add(new_request)
-            db.session.commit()
-            flash("Request created successfully","success")
-            return redirect(url_for("customer_dashboard"))
+        new_request = ServiceRequest(service_id=service_id, customer_id=session['user_id'])
+        service.service_requests.append(new_request)
+        db.session.add(new_request)
+        db.session.flush()
+        record_request_event("created", new_request.id)
+        db.session.commit()
+        flash("Request created successfully","success")
+        return redirect(url_for("customer_dashboard"))
 
 # Creating a private request
 
 @app.route("/customer/create/request/<int:service_id>/<int:professional_id>")
+@customer_required
 def create_private_request(service_id, professional_id):
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
+    if ServiceRequest.query.filter_by(service_id=service_id, customer_id=session['user_id'],professional_id=professional_id , service_status="Requested").first() != None:
+        flash("You already have a request open for this service","error")
+        return redirect(url_for("customer_dashboard"))
+    elif ServiceRequest.query.filter_by(service_id=service_id, customer_id=session['user_id'],professional_id=professional_id , service_status="Accepted").first() != None:
+        flash("You already have a request open for this service","error")
+        return redirect(url_for("customer_dashboard"))
     else:
-        if ServiceRequest.query.filter_by(service_id=service_id, customer_id=session['user_id'],professional_id=professional_id , service_status="Requested").first() != None:
-            flash("You already have a request open for this service","error")
-            return redirect(url_for("customer_dashboard"))
-        elif ServiceRequest.query.filter_by(service_id=service_id, customer_id=session['user_id'],professional_id=professional_id , service_status="Accepted").first() != None:
-            flash("You already have a request open for this service","error")
-            return redirect(url_for("customer_dashboard"))
-        else:
-            service = Services.query.filter_by(serv_id=service_id).first()
-            new_request = ServiceRequest(service_id=service_id, customer_id=session['user_id'], professional_id=professional_id)
-            service.service_requests.append(new_request)
-            customer = Customer.query.filter_by(cust_id=session['user_id']).first()
-            customer.service_request.append(new_request)
-            db.session.add(new_request)
-            db.session.commit()
-            flash("Request created successfully","success")
-            return redirect(url_for("customer_dashboard"))
+        service = Services.query.filter_by(serv_id=service_id).first()
+        new_request = ServiceRequest(service_id=service_id, customer_id=session['user_id'], professional_id=professional_id)
+        service.service_requests.append(new_request)
+        db.session.add(new_request)
+        db.session.flush()
+        record_request_event("created", new_request.id)
+        db.session.commit()
+        flash("Request created successfully","success")
+        return redirect(url_for("customer_dashboard"))
 
 # Editing a request
 
 @app.route("/customer/edit/request/<int:request_id>", methods=["GET", "POST"])
+@customer_required
 def edit_request(request_id):
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        req = ServiceRequest.query.filter_by(id=request_id).first()
-        dor = datetime.strptime(req.date_of_request, "%d/%m/%Y").date().strftime("%Y-%m-%d")
-        if request.method == "POST":
-            if req.service_status == "Closed":
-                req.remarks = request.form["remark"]
-                db.session.commit()
-                flash("Request edited successfully","success")
-                return redirect(url_for("customer_dashboard"))
-            else:
-                new_date_of_req = datetime.strptime(request.form["date_of_req"], "%Y-%m-%d").date().strftime("%d/%m/%Y")
-                req.date_of_request = new_date_of_req 
-                db.session.commit()
-                flash("Request edited successfully","success")
-                return redirect(url_for("customer_dashboard"))
-        
-        return render_template("edit_request.html", req=req, dor=dor)
+    req = ServiceRequest.query.filter_by(id=request_id).first()
+    dor = req.date_of_request.strftime("%Y-%m-%d")
+    if request.method == "POST":
+        if req.service_status == "Closed":
+            req.remarks = request.form["remark"]
+            db.session.commit()
+            flash("Request edited successfully","success")
+            return redirect(url_for("customer_dashboard"))
+        else:
+            new_date_of_req = datetime.strptime(request.form["date_of_req"], "%Y-%m-%d").date()
+            req.date_of_request = new_date_of_req 
+            db.session.commit()
+            flash("Request edited successfully","success")
+            return redirect(url_for("customer_dashboard"))
+    
+    return render_template("edit_request.html", req=req, dor=dor)
 
 # Delete Request
 
 @app.route("/customer/delete/request/<int:request_id>")
+@customer_required
 def delete_request(request_id):
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        req = ServiceRequest.query.filter_by(id=request_id).first()
-        db.session.delete(req)
-        db.session.commit()
-        flash("Request deleted successfully","success")
-        return redirect(url_for("customer_dashboard"))
+    req = ServiceRequest.query.filter_by(id=request_id).first()
+    db.session.delete(req)
+    db.session.commit()
+    flash("Request deleted successfully","success")
+    return redirect(url_for("customer_dashboard"))
 
 # Closing Requests
 
 @app.route("/customer/close/request/<int:request_id>", methods=["GET", "POST"])
+@customer_required
 def close_request(request_id):
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
-    else:
-        current_date = datetime.now().date().strftime("%d/%m/%Y")
-        req = ServiceRequest.query.filter_by(id=request_id).first()
-        pro = ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()
-        if request.method == "POST":
-            rating = request.form["rating"]
-            remarks = request.form["remarks"]
-            req.ratings = rating
-            req.remarks = remarks
-            req.date_of_completion = current_date
-            req.service_status = "Closed"
-            db.session.commit()
+    current_date = date.today()
+    req = ServiceRequest.query.filter_by(id=request_id).first()
+    pro = ServiceProfessional.query.filter_by(pro_id=req.professional_id).first()
+    if request.method == "POST":
+        rating = int(request.form["rating"])
+        remarks = request.form["remarks"]
 
-            # Updating average rating of professional
-            sum_ratings = 0
-            count_closed_req = 0
-            for req in pro.all_requests:
-                if req.service_status == "Closed":
-                    sum_ratings += req.ratings
-                    count_closed_req += 1
-            if len(pro.all_requests) != 0:
-                pro.avg_rating = sum_ratings / count_closed_req
-            db.session.commit()
+        # Updating rating totals and average of professional in the same transaction,
+        # a request closed again only replaces its previous rating
+        if pro != None:
+            if req.service_status == "Closed":
+                added_sum = rating - (req.ratings or 0)
+                added_count = 0
+            else:
+                added_sum = rating
+                added_count = 1
+            new_sum = ServiceProfessional.rating_sum + added_sum
+            new_count = ServiceProfessional.rating_count + added_count
+            ServiceProfessional.query.filter_by(pro_id=pro.pro_id).update({
+                ServiceProfessional.rating_sum: new_sum,
+                ServiceProfessional.rating_count: new_count,
+                ServiceProfessional.avg_rating: new_sum * 1.0 / new_count,
+            }, synchronize_session=False)
+
+        req.ratings = rating
+        req.remarks = remarks
+        req.date_of_completion = current_date
+        req.service_status = "Closed"
+        record_request_event("closed", req.id)
+        db.session.commit()
+
+        flash("Request closed successfully","success")
+        return redirect(url_for("customer_dashboard"))
+    return render_template("close_request.html", pro=pro, req=req, current_date=current_date)
 
-            flash("Request closed successfully","success")
-            return redirect(url_for("customer_dashboard"))
-        return render_template("close_request.html", pro=pro, req=req, current_date=current_date)
-    
 # Customer Dashboard Search
 
 @app.route("/customer/dashboard/search", methods=["GET", "POST"])
+@customer_required
 def customer_dashboard_search():
-    if Customer.query.filter_by(cust_id=session['user_id']).first() != None:
-        if request.method == "POST":
-            filter = request.form["filter"]
-            search_input = request.form["search_input"]
-            if filter == "service_name":
-                services = Services.query.filter(Services.name.ilike("%"+search_input+"%"),ServiceProfessional.approval_status=="Approved").all()
-                all_pros = []
-                for serv in services:
-                    all_pros.extend(serv.professionals)
-                service_professionals = []
-                for pro in all_pros:
-                    service_professionals.append((pro, Services.query.filter_by(name=pro.service_type).first()))
-                return render_template("customer_dashboard_search.html", service_professionals=service_professionals, last_input=search_input, filter_search=filter)
-            elif filter == "pro_pincode":
-                pros = ServiceProfessional.query.filter(ServiceProfessional.pincode.ilike("%"+search_input+"%"),ServiceProfessional.approval_status=="Approved").all()
-                service_professionals = []
-                for pro in pros:
-                    service_professionals.append((pro, Services.query.filter_by(name=pro.service_type).first()))
-                return render_template("customer_dashboard_search.html", service_professionals=service_professionals, last_input=search_input, filter_search=filter)
-            elif filter == "professional_name":
-                professional_user_name = ServiceProfessional.query.filter(ServiceProfessional.user_name.ilike("%"+search_input+"%"),ServiceProfessional.approval_status=="Approved").all()
-                pros = professional_user_name
-                service_professionals = []
-                for pro in pros:
-                    service_professionals.append((pro, Services.query.filter_by(name=pro.service_type).first()))
-                return render_template("customer_dashboard_search.html", service_professionals=service_professionals, last_input=search_input, filter_search=filter)
-            elif filter == "avg_ratings":
-                pros = ServiceProfessional.query.filter(ServiceProfessional.avg_rating  >= search_input, ServiceProfessional.approval_status=="Approved").all()
-                service_professionals = []
-                for pro in pros:
-                    service_professionals.append((pro, Services.query.filter_by(name=pro.service_type).first()))
-                return render_template("customer_dashboard_search.html", service_professionals=service_professionals, last_input=search_input, filter_search=filter)
-        all_pros = ServiceProfessional.query.filter_by(approval_status="Approved").all()
-        service_professionals = []
-        for pro in all_pros:
-            service_professionals.append((pro, Services.query.filter_by(name=pro.service_type).first()))
-        return render_template("customer_dashboard_search.html", service_professionals=service_professionals)
+    # Filters come from the search form or from the query string of the page links
+    filter = request.values.get("filter")
+    search_input = request.values.get("search_input", "")
+    criteria = []
+    matches = None
+    match_key = None
+    if filter == "service_name":
+        matches = search_matches(SEARCH_SERVICE, ["name"], search_input)
+        match_key = Services.serv_id
+    elif filter == "pro_pincode":
+        matches = search_matches(SEARCH_PROFESSIONAL, ["pincode"], search_input)
+        match_key = ServiceProfessional.pro_id
+    elif filter == "professional_name":
+        matches = search_matches(SEARCH_PROFESSIONAL, ["user_name"], search_input)
+        match_key = ServiceProfessional.pro_id
+    elif filter == "avg_ratings":
+        criteria = [ServiceProfessional.avg_rating >= search_input]
+    query = professional_rows(*criteria, matches=matches, match_key=match_key)
+    if matches != None:
+        page = keyset_page(query, [matches.c.rank, ServiceProfessional.pro_id])
     else:
-        flash("Unauthorized Access", "error")
-        return redirect(url_for("home"))
+        page = keyset_page(query, [ServiceProfessional.pro_id])
+    return render_template("customer_dashboard_search.html", service_professionals=page.rows, page=page, last_input=search_input, filter_search=filter)
 
 # Customer Dashboard Summary
 @app.route("/customer/dashboard/summary")
+@customer_required
 def customer_dashboard_summary():
-    if Customer.query.filter_by(cust_id=session['user_id']).first() == None:
-        flash("Unauthorised Access","error")
-        return redirect(url_for("home"))
+    x = ['Requested', 'Accepted', 'Closed', 'Expired']
+    counts = status_counts(ServiceRequest.customer_id == session['user_id'])
+    y = [counts.get("Requested", 0), counts.get("Accepted", 0), counts.get("Closed", 0), counts.get("Expired", 0)]
+    return render_template("customer_dashboard_summary.html", x=x, y=y)
+
+# Live updates of the dashboards as server-sent events
+
+@app.route("/events")
+def request_events():
+    if identity_allowed("customer"):
+        subscriber = {"role": "customer", "user_id": session["user_id"], "service_id": None}
+    elif identity_allowed("professional"):
+        service_type = current_professional().service_type
+        service_id = next((service.serv_id for service in service_catalog() if service.name == service_type), None)
+        subscriber = {"role": "professional", "user_id": session["user_id"], "service_id": service_id}
     else:
-        x = ['Requested', 'Accepted', 'Closed']
-        rec_req = len(ServiceRequest.query.filter_by(customer_id=session['user_id'], service_status="Requested").all())
-        acc_req = len(ServiceRequest.query.filter_by(customer_id=session['user_id'], service_status="Accepted").all())
-        clo_req = len(ServiceRequest.query.filter_by(customer_id=session['user_id'], service_status="Closed").all())
-        y = [rec_req, acc_req,  clo_req]
-        return render_template("customer_dashboard_summary.html", x=x, y=y)
+        abort(403)
+    subscriber["queue"] = queue.Queue(maxsize=100)
+    subscriber["behind"] = False
+    subscribe_events(subscriber, request.headers.get("Last-Event-ID", type=int))
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if subscriber["behind"]:
+                    # Events were missed, the page has to be loaded again
+                    yield "event: reload\ndata: {}\n\n"
+                    return
+                try:
+                    event = subscriber["queue"].get(timeout=app.config['EVENT_HEARTBEAT'])
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "id: %d\nevent: %s\ndata: %s\n\n" % (event["id"], event["kind"], json.dumps({"request_id": event["request_id"]}))
+        finally:
+            unsubscribe_events(subscriber)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Metrics of every endpoint as JSON, or Prometheus text with ?format=prometheus
+
+@app.route("/admin/metrics")
+@admin_required
+def admin_metrics():
+    snapshot = metrics_snapshot()
+    dispatch = dispatch_snapshot()
+    if request.args.get("format") != "prometheus":
+        return jsonify(dict(snapshot, dispatcher=dispatch))
+    lines = []
+    for name in ["wall_seconds", "db_seconds", "db_statements"]:
+        lines.append("# TYPE household_request_" + name + " summary")
+        for endpoint, stats in snapshot.items():
+            # Endpoints that only shed requests have no timings
+            if name not in stats:
+                continue
+            for quantile, key in [("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")]:
+                lines.append('household_request_%s{endpoint="%s",quantile="%s"} %s' % (name, endpoint, quantile, stats[name][key]))
+            lines.append('household_request_%s_count{endpoint="%s"} %d' % (name, endpoint, stats["count"]))
+    lines.append("# TYPE household_requests_shed_total counter")
+    for endpoint, stats in snapshot.items():
+        for key, shed in stats.get("shed", {}).items():
+            lines.append('household_requests_shed_total{endpoint="%s",key="%s"} %d' % (endpoint, key, shed))
+    for name in ["queue_depth", "oldest_waiting_seconds", "leader"]:
+        lines.append("# TYPE household_dispatch_" + name + " gauge")
+        lines.append("household_dispatch_%s %s" % (name, float(dispatch[name])))
+    for name in ["runs", "assigned", "expired"]:
+        lines.append("# TYPE household_dispatch_" + name + "_total counter")
+        lines.append("household_dispatch_%s_total %d" % (name, dispatch[name]))
+    if "assignment_seconds" in dispatch:
+        lines.append("# TYPE household_dispatch_assignment_seconds summary")
+        for quantile, key in [("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")]:
+            lines.append('household_dispatch_assignment_seconds{quantile="%s"} %s' % (quantile, dispatch["assignment_seconds"][key]))
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# Synthetic Data
+# Fills an empty database with services, customers, professionals and requests for benchmarks.
+# All generated users share one hash of the password "password", hashing a million passwords takes hours.
+
+GENERATED_SERVICES = ["Plumbing", "Electrical", "Carpentry", "Painting", "Cleaning", "Pest Control", "AC Repair", "Appliance Repair", "Gardening", "Salon at Home",
+                      "Laundry", "Cooking", "Babysitting", "Elder Care", "Home Shifting", "Water Purifier Service", "CCTV Installation", "Interior Design", "Car Wash", "Tutoring"]
+GENERATED_NAMES = ["Aarav", "Vivaan", "Aditya", "Ananya", "Diya", "Ishaan", "Kavya", "Meera", "Rohan", "Saanvi", "Arjun", "Priya", "Rahul", "Sneha", "Vikram", "Neha"]
+GENERATED_SURNAMES = ["Sharma", "Verma", "Iyer", "Reddy", "Patel", "Nair", "Gupta", "Singh", "Das", "Rao", "Mehta", "Joshi"]
+GENERATED_PINCODE_PREFIXES = ["1100", "1220", "2010", "3800", "4000", "4110", "5000", "5600", "6000", "7000"]
+# Share of requests in each status, half of the Requested ones are public
+GENERATED_STATUSES = {"Requested": 0.2, "Accepted": 0.25, "Closed": 0.45, "Rejected": 0.1}
+GENERATED_APPROVALS = {"Approved": 0.85, "Pending": 0.1, "Blocked": 0.05}
+# Share of closed requests rated 1 to 5
+GENERATED_RATINGS = [0.05, 0.07, 0.15, 0.33, 0.4]
+
+@app.cli.command("generate-data")
+@click.option("--requests", "request_count", default=10000, show_default=True, help="Service requests to create.")
+@click.option("--customers", default=None, type=int, help="Customers to create, one per 10 requests by default.")
+@click.option("--professionals", default=None, type=int, help="Professionals to create, one per 50 requests by default.")
+@click.option("--services", default=len(GENERATED_SERVICES), show_default=True, help="Services to create.")
+@click.option("--seed", default=42, show_default=True, help="The same seed generates the same data.")
+@click.option("--batch-size", default=10000, show_default=True, help="Rows inserted per statement.")
+def generate_data(request_count, customers, professionals, services, seed, batch_size):
+    create_tables()
+    create_search_index()
+    create_rollup_triggers()
+    for model in [Services, Customer, ServiceProfessional, ServiceRequest]:
+        if db.session.query(model).first() != None:
+            raise click.ClickException("The database already has data, generate into an empty database")
+    customers = customers or max(1, request_count // 10)
+    professionals = professionals or max(1, request_count // 50)
+    rng = random.Random(seed)
+    password_hash = generate_password_hash("password", method=app.config['PASSWORD_HASH_METHOD'])
+    pincodes = [prefix + "%02d" % number for prefix in GENERATED_PINCODE_PREFIXES for number in range(1, 31)]
+    start = time.perf_counter()
+
+    def insert_rows(model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                db.session.execute(insert(model), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(model), batch)
+        db.session.commit()
+
+    def person(index, prefix):
+        return {"user_name": prefix + str(index), "password": password_hash, "first_name": rng.choice(GENERATED_NAMES),
+                "last_name": rng.choice(GENERATED_SURNAMES), "contact": 9000000000 + index,
+                "date_created": date.today() - timedelta(days=rng.randint(0, 730))}
+
+    service_names = [GENERATED_SERVICES[i] if i < len(GENERATED_SERVICES) else "Service " + str(i + 1) for i in range(services)]
+    insert_rows(Services, ({"name": name, "price": rng.randrange(100, 2000, 50), "time_required": rng.randint(1, 8),
+                            "description": name + " at your home"} for name in service_names))
+    service_ids = dict(db.session.query(Services.name, Services.serv_id))
+
+    insert_rows(Customer, (dict(person(i, "customer"), address="House " + str(rng.randint(1, 500)) + ", Street " + str(rng.randint(1, 80)),
+                                pin_code=int(rng.choice(pincodes))) for i in range(1, customers + 1)))
+    customer_ids = [row[0] for row in db.session.query(Customer.cust_id)]
+
+    insert_rows(ServiceProfessional, (dict(person(i, "professional"), description="Experienced in " + service.lower(), service_type=service,
+                                           experience=rng.randint(0, 30), pincode=rng.choice(pincodes),
+                                           approval_status=rng.choices(list(GENERATED_APPROVALS), list(GENERATED_APPROVALS.values()))[0])
+                                      for i in range(1, professionals + 1) for service in [rng.choice(service_names)]))
+    service_professionals = {}
+    for pro_id, service_type in db.session.query(ServiceProfessional.pro_id, ServiceProfessional.service_type).filter_by(approval_status="Approved"):
+        service_professionals.setdefault(service_type, []).append(pro_id)
+
+    def service_request():
+        service = rng.choice(service_names)
+        status = rng.choices(list(GENERATED_STATUSES), list(GENERATED_STATUSES.values()))[0]
+        pros = service_professionals.get(service)
+        professional_id = rng.choice(pros) if pros else None
+        if professional_id == None or (status == "Requested" and rng.random() < 0.5):
+            status = "Requested"
+            professional_id = None
+        requested = date.today() - timedelta(days=rng.randint(0, 365))
+        row = {"service_id": service_ids[service], "customer_id": rng.choice(customer_ids), "professional_id": professional_id,
+               "date_of_request": requested, "service_status": status, "ratings": 0, "remarks": None}
+        if status == "Closed":
+            row["date_of_completion"] = min(date.today(), requested + timedelta(days=rng.randint(0, 14)))
+            row["ratings"] = rng.choices([1, 2, 3, 4, 5], GENERATED_RATINGS)[0]
+            row["remarks"] = rng.choice(["Good work", "On time", "Could be better", "Excellent service", None])
+        return row
+
+    insert_rows(ServiceRequest, (service_request() for _ in range(request_count)))
+    update_rating_totals()
+    invalidate_service_catalog()
+    reset_match_index()
+    click.echo("Generated " + str(services) + " services, " + str(customers) + " customers, " + str(professionals) + " professionals and "
+               + str(request_count) + " requests in " + ("%.1f" % (time.perf_counter() - start)) + "s")
+
+# Route Benchmarks
+# Every page that only reads is requested through the test client, with the sessions of the admin
+# and of the customer and professional with the most requests. Results are written as JSON so
+# that runs can be compared with --baseline.
+
+def benchmark_routes():
+    customer_id = db.session.query(ServiceRequest.customer_id).group_by(ServiceRequest.customer_id).order_by(db.func.count().desc()).limit(1).scalar()
+    professional_id = db.session.query(ServiceRequest.professional_id)\
+        .join(ServiceProfessional, ServiceProfessional.pro_id == ServiceRequest.professional_id)\
+        .filter(ServiceProfessional.approval_status == "Approved")\
+        .group_by(ServiceRequest.professional_id).order_by(db.func.count().desc()).limit(1).scalar()
+    if customer_id == None or professional_id == None:
+        raise click.ClickException("The database has no requests to benchmark with, run generate-data first")
+    customer = db.session.get(Customer, customer_id)
+    professional = db.session.get(ServiceProfessional, professional_id)
+    service_id = db.session.query(Services.serv_id).filter_by(name=professional.service_type).scalar()
+    request_id = db.session.query(ServiceRequest.id).filter_by(customer_id=customer_id).order_by(ServiceRequest.id.desc()).limit(1).scalar()
+    day = db.session.query(ServiceRequest.date_of_request).filter_by(id=request_id).scalar()
+
+    routes = [
+        # (name, role, endpoint, arguments)
+        ("home", None, "home", {}),
+        ("customer_login", None, "customer_login", {}),
+        ("employee_login", None, "employee_login", {}),
+        ("customer_register", None, "customer_register", {}),
+        ("employee_register", None, "employee_register", {}),
+        ("admin_dashboard", "admin", "admin_dashboard", {}),
+        ("admin_dashboard_summary", "admin", "admin_dashboard_summary", {}),
+        ("admin_dashboard_search", "admin", "admin_dashboard_search", {}),
+        ("admin_dashboard_search[service_name]", "admin", "admin_dashboard_search", {"filter": "service_name", "search_input": professional.service_type}),
+        ("admin_dashboard_search[professional_name]", "admin", "admin_dashboard_search", {"filter": "professional_name", "search_input": professional.first_name}),
+        ("admin_dashboard_search[customer_name]", "admin", "admin_dashboard_search", {"filter": "customer_name", "search_input": customer.first_name}),
+        ("admin_dashboard_search[date_of_req]", "admin", "admin_dashboard_search", {"filter": "date_of_req", "date_from": (day - timedelta(days=7)).isoformat(), "date_to": day.isoformat()}),
+        ("admin_dashboard_export[csv]", "admin", "admin_dashboard_export", {"filter": "customer_name", "search_input": customer.user_name}),
+        ("admin_dashboard_export[jsonl]", "admin", "admin_dashboard_export", {"filter": "customer_name", "search_input": customer.user_name, "format": "jsonl"}),
+        ("create_service", "admin", "create_service", {}),
+        ("edit_service", "admin", "edit_service", {"service_id": service_id}),
+        ("admin_metrics", "admin", "admin_metrics", {}),
+        ("professional_dashboard", "professional", "professional_dashboard", {}),
+        ("professional_dashboard_summary", "professional", "professional_dashboard_summary", {}),
+        ("customer_dashboard", "customer", "customer_dashboard", {}),
+        ("customer_view_service", "customer", "customer_view_service", {"service_id": service_id}),
+        ("customer_dashboard_search", "customer", "customer_dashboard_search", {}),
+        ("customer_dashboard_search[service_name]", "customer", "customer_dashboard_search", {"filter": "service_name", "search_input": professional.service_type}),
+        ("customer_dashboard_search[pro_pincode]", "customer", "customer_dashboard_search", {"filter": "pro_pincode", "search_input": professional.pincode[:3]}),
+        ("customer_dashboard_search[professional_name]", "customer", "customer_dashboard_search", {"filter": "professional_name", "search_input": professional.user_name[:6]}),
+        ("customer_dashboard_search[avg_ratings]", "customer", "customer_dashboard_search", {"filter": "avg_ratings", "search_input": "4"}),
+        ("customer_dashboard_summary", "customer", "customer_dashboard_summary", {}),
+        ("edit_request", "customer", "edit_request", {"request_id": request_id}),
+        ("close_request", "customer", "close_request", {"request_id": request_id}),
+    ]
+    sessions = {
+        None: {},
+        "admin": {"user_id": "admin", "user_username": "admin", "user_role": "admin"},
+        "customer": {"user_id": customer.cust_id, "user_username": customer.user_name, "user_role": "customer"},
+        "professional": {"user_id": professional.pro_id, "user_username": professional.user_name, "user_role": "professional"},
+    }
+    with app.test_request_context():
+        return [(name, role, url_for(endpoint, **arguments)) for name, role, endpoint, arguments in routes], sessions
+
+@app.cli.command("benchmark-routes")
+@click.option("--iterations", default=50, show_default=True, help="Timed requests per route.")
+@click.option("--route", "selected", multiple=True, help="Only benchmark routes whose name starts with this, can be repeated.")
+@click.option("--output", default=None, help="JSON file to write the results to.")
+@click.option("--baseline", default=None, help="JSON results of an earlier run to compare with.")
+def benchmark_routes_command(iterations, selected, output, baseline):
+    # The dispatcher would change the requests while they are timed
+    app.config['DISPATCH_INTERVAL'] = None
+    routes, sessions = benchmark_routes()
+    clients = {}
+    for role, values in sessions.items():
+        clients[role] = app.test_client()
+        with clients[role].session_transaction() as client_session:
+            client_session.update(values)
+
+    statements = {"count": 0}
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements["count"] += 1
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+
+    results = {}
+    try:
+        for name, role, path in routes:
+            if selected and not any(name.startswith(prefix) for prefix in selected):
+                continue
+            client = clients[role]
+            # Warming up caches, then timing, then measuring memory separately since tracing slows everything down
+            response = client.get(path)
+            response.get_data()
+            durations = []
+            counts = []
+            for _ in range(iterations):
+                statements["count"] = 0
+                start = time.perf_counter()
+                response = client.get(path)
+                response.get_data()
+                durations.append(time.perf_counter() - start)
+                counts.append(statements["count"])
+            tracemalloc.start()
+            client.get(path).get_data()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            durations.sort()
+            counts.sort()
+            results[name] = {
+                "path": path,
+                "status": response.status_code,
+                "p50_ms": round(percentile(durations, 0.5) * 1000, 3),
+                "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+                "statements": percentile(counts, 0.5),
+                "peak_memory_kb": round(peak / 1024, 1),
+            }
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    previous = {}
+    if baseline != None:
+        with open(baseline) as file:
+            previous = json.load(file)["routes"]
+    click.echo("%-46s %6s %10s %10s %6s %10s" % ("route", "status", "p50 ms", "p99 ms", "sql", "peak KB"))
+    for name, result in results.items():
+        line = "%-46s %6d %10.2f %10.2f %6d %10.1f" % (name, result["status"], result["p50_ms"], result["p99_ms"], result["statements"], result["peak_memory_kb"])
+        if name in previous and previous[name]["p50_ms"] > 0:
+            line += "  p50 %+.0f%%" % ((result["p50_ms"] / previous[name]["p50_ms"] - 1) * 100)
+        click.echo(line)
+    if output != None:
+        counts = {model.__tablename__: db.session.query(model).count() for model in [Services, Customer, ServiceProfessional, ServiceRequest]}
+        with open(output, "w") as file:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"), "iterations": iterations, "rows": counts, "routes": results}, file, indent=2)
 
 ## Logout
 
@@ -780,6 +2631,10 @@ def logout():
     return redirect(url_for("home"))
 
 if __name__=="__main__":
+    with app.app_context():
+        create_tables()
+        create_search_index()
+        create_rollup_triggers()
     app.run(debug=True)
 
 
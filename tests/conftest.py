@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+database_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(database_dir, "test.sqlite3")
+
+import main
+from main import app, db
+
+# A fresh database and empty caches for every test
+@pytest.fixture
+def client():
+    app.config['DISPATCH_INTERVAL'] = None
+    app.config['CATALOG_VERSION_FILE'] = os.path.join(database_dir, "catalog_version")
+    with app.app_context():
+        db.engine.dispose()
+        for suffix in ["", "-wal", "-shm"]:
+            path = os.path.join(database_dir, "test.sqlite3" + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+        main.create_tables()
+        main.create_search_index()
+        main.create_rollup_triggers()
+        main.invalidate_service_catalog()
+        main.reset_match_index()
+        main.identity_cache.clear()
+        main.rate_buckets.clear()
+        main.rate_limit_shed.clear()
+        main.route_metrics.clear()
+    yield app.test_client()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def login(client, role, user_id, user_name):
+    with client.session_transaction() as session:
+        session.update({"user_id": user_id, "user_username": user_name, "user_role": role})
+
+# One service with a customer and an approved professional, returns their ids
+def seed_users(pincode="560001"):
+    service = main.Services(name="Plumbing", price=100, time_required=1, description="Pipes")
+    customer = main.Customer(user_name="customer1", password="x", first_name="Asha", last_name="Rao", address="House 1", pin_code=int(pincode), contact=1)
+    professional = main.ServiceProfessional(user_name="professional1", password="x", first_name="Ravi", last_name="Iyer", description="Plumber",
+                                            service_type="Plumbing", experience=3, contact=2, pincode=pincode, approval_status="Approved")
+    db.session.add_all([service, customer, professional])
+    db.session.commit()
+    main.invalidate_service_catalog()
+    return service.serv_id, customer.cust_id, professional.pro_id
@@ -0,0 +1,71 @@
+import main
+from main import app, db
+from conftest import login, seed_users
+
+def add_pending_professional():
+    professional = main.ServiceProfessional(user_name="pending", password="x", first_name="Mala", description="Plumber", service_type="Plumbing",
+                                            experience=2, contact=5, pincode="560001", approval_status="Pending")
+    db.session.add(professional)
+    db.session.commit()
+    return professional.pro_id
+
+def allowed(client, path):
+    response = client.get(path)
+    return response.status_code == 200
+
+def test_wrong_role_is_redirected(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+    # The customer and the professional both have id 1, only the role in the session tells them apart
+    assert customer_id == professional_id
+    login(client, "customer", customer_id, "customer1")
+    response = client.get("/professional/dashboard")
+    assert response.status_code == 302 and response.location.endswith("/")
+    assert client.get("/admin/dashboard").status_code == 302
+    assert allowed(client, "/customer/dashboard")
+    login(client, "professional", professional_id, "professional1")
+    assert client.get("/customer/dashboard").status_code == 302
+    assert allowed(client, "/professional/dashboard")
+
+def test_anonymous_users_get_no_event_stream(client):
+    assert client.get("/events").status_code == 403
+    assert client.get("/customer/dashboard").status_code == 302
+
+def test_cached_identity_is_forgotten_on_approve_block_and_unblock(client):
+    with app.app_context():
+        seed_users()
+        pro_id = add_pending_professional()
+    admin = app.test_client()
+    login(admin, "admin", "admin", "admin")
+    login(client, "professional", pro_id, "pending")
+
+    # Refused while pending, and the refusal is cached
+    assert not allowed(client, "/professional/dashboard")
+    assert main.identity_cache[("professional", pro_id)][0] == False
+    assert admin.get("/admin/approve/professional/" + str(pro_id)).status_code == 302
+    assert allowed(client, "/professional/dashboard")
+
+    # Allowed and cached, blocking takes effect on the next request
+    assert main.identity_cache[("professional", pro_id)][0] == True
+    assert admin.get("/admin/block/professional/" + str(pro_id)).status_code == 302
+    assert not allowed(client, "/professional/dashboard")
+    assert admin.get("/admin/unblock/professional/" + str(pro_id)).status_code == 302
+    assert allowed(client, "/professional/dashboard")
+
+    # Rejected professionals are deleted and refused at once
+    assert admin.get("/admin/reject/professional/" + str(pro_id)).status_code == 302
+    assert not allowed(client, "/professional/dashboard")
+
+def test_cached_refusal_lasts_until_the_ttl_without_an_admin_action(client):
+    with app.app_context():
+        seed_users()
+        pro_id = add_pending_professional()
+    login(client, "professional", pro_id, "pending")
+    assert not allowed(client, "/professional/dashboard")
+    # Approved behind the cache's back, as by another worker
+    with app.app_context():
+        main.ServiceProfessional.query.filter_by(pro_id=pro_id).update({"approval_status": "Approved"})
+        db.session.commit()
+    assert not allowed(client, "/professional/dashboard")
+    main.identity_cache.clear()
+    assert allowed(client, "/professional/dashboard")
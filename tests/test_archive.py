@@ -0,0 +1,80 @@
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+def add_professional(user_name, contact):
+    professional = main.ServiceProfessional(user_name=user_name, password="x", first_name="Ravi", description="Plumber",
+                                            service_type="Plumbing", experience=3, contact=contact, pincode="560001", approval_status="Approved")
+    db.session.add(professional)
+    db.session.commit()
+    return professional.pro_id
+
+# Archiving the newest request must not let the next request take its id
+def archive_newest_and_add_another(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        second = add_professional("professional2", 3)
+        db.session.add_all([main.ServiceRequest(service_id=service_id, customer_id=customer_id, professional_id=professional_id),
+                            main.ServiceRequest(service_id=service_id, customer_id=customer_id, professional_id=second)])
+        db.session.commit()
+    login(client, "admin", "admin", "admin")
+    assert client.get("/admin/reject/professional/" + str(second)).status_code == 302
+    with app.app_context():
+        third = add_professional("professional3", 4)
+        new_request = main.ServiceRequest(service_id=service_id, customer_id=customer_id, professional_id=third)
+        db.session.add(new_request)
+        db.session.commit()
+        assert new_request.id == 3
+    assert client.get("/admin/reject/professional/" + str(third)).status_code == 302
+    with app.app_context():
+        assert sorted(db.session.execute(text("SELECT id FROM archived_service_request")).scalars()) == [2, 3]
+
+def test_archived_ids_are_not_reused(client):
+    archive_newest_and_add_another(client)
+
+# A request table created before AUTOINCREMENT is rebuilt by init-db, keeping its requests and indexes
+def test_init_db_rebuilds_the_request_table(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        db.session.execute(text("INSERT INTO archived_service_request (id, service_status) VALUES (7, 'Closed')"))
+        definition = str(CreateTable(main.ServiceRequest.__table__).compile(db.engine)).replace("AUTOINCREMENT", "")
+        db.session.execute(text("DROP TABLE servicerequest"))
+        db.session.execute(text(definition))
+        db.session.execute(text("INSERT INTO servicerequest (id, service_id, customer_id, professional_id, date_of_request, service_status, version) "
+                                "VALUES (1, :service_id, :customer_id, :professional_id, '2026-01-01', 'Requested', 1)"),
+                           {"service_id": service_id, "customer_id": customer_id, "professional_id": professional_id})
+        db.session.execute(text("DELETE FROM sqlite_sequence"))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert "AUTOINCREMENT" in db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'servicerequest'")).scalar()
+        assert db.session.execute(text("SELECT id, service_status FROM servicerequest")).all() == [(1, "Requested")]
+        indexes = set(db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'servicerequest'")).scalars())
+        assert {index.name for index in main.ServiceRequest.__table__.indexes} <= indexes
+        triggers = set(db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'servicerequest'")).scalars())
+        assert "servicerequest_rollup_insert" in triggers
+        new_request = main.ServiceRequest(service_id=service_id, customer_id=customer_id)
+        db.session.add(new_request)
+        db.session.commit()
+        assert new_request.id == 8
+
+def test_rebuilt_ratings_count_archived_requests(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        db.session.execute(text("INSERT INTO servicerequest (service_id, customer_id, professional_id, date_of_request, date_of_completion, service_status, ratings, version) "
+                                "VALUES (:service_id, :customer_id, :professional_id, :day, :day, 'Closed', :rating, 1)"),
+                           [{"service_id": service_id, "customer_id": customer_id, "professional_id": professional_id, "day": day, "rating": rating}
+                            for day, rating in [("2020-01-01", 2), ("2026-01-01", 5)]])
+        db.session.commit()
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=["rebuild-ratings"]).exit_code == 0
+    assert runner.invoke(args=["archive-requests", "--days", "365"]).exit_code == 0
+    assert runner.invoke(args=["rebuild-ratings"]).exit_code == 0
+    with app.app_context():
+        assert db.session.query(main.ArchivedServiceRequest).count() == 1
+        professional = db.session.get(main.ServiceProfessional, professional_id)
+        assert (professional.rating_sum, professional.rating_count, professional.avg_rating) == (7, 2, 3.5)
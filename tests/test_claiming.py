@@ -0,0 +1,59 @@
+import threading
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+THREADS = 8
+REQUESTS = 5
+
+def test_each_public_request_is_claimed_once(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        professionals = [professional_id]
+        for number in range(2, THREADS + 1):
+            professional = main.ServiceProfessional(user_name="professional" + str(number), password="x", first_name="Ravi", description="Plumber",
+                                                    service_type="Plumbing", experience=3, contact=number, pincode="560001", approval_status="Approved")
+            db.session.add(professional)
+            db.session.flush()
+            professionals.append(professional.pro_id)
+        requests = [main.ServiceRequest(service_id=service_id, customer_id=customer_id) for _ in range(REQUESTS)]
+        db.session.add_all(requests)
+        db.session.commit()
+        request_ids = [req.id for req in requests]
+
+    barrier = threading.Barrier(THREADS)
+    outcomes = {}
+    errors = []
+
+    def claim(pro_id):
+        worker = app.test_client()
+        login(worker, "professional", pro_id, "professional" + str(pro_id))
+        try:
+            barrier.wait()
+            for request_id in request_ids:
+                response = worker.get("/professional/accept/request/" + str(request_id))
+                assert response.status_code == 302
+                with worker.session_transaction() as session:
+                    (category, message), = session.pop("_flashes")
+                outcomes[(pro_id, request_id)] = message
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=claim, args=(pro_id,)) for pro_id in professionals]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+    with app.app_context():
+        claimed = dict(db.session.query(main.ServiceRequest.id, main.ServiceRequest.professional_id).filter(main.ServiceRequest.id.in_(request_ids)))
+        assert db.session.query(main.ServiceRequest).filter(main.ServiceRequest.id.in_(request_ids), main.ServiceRequest.service_status == "Accepted").count() == REQUESTS
+        events = db.session.query(main.RequestEvent.request_id).filter_by(kind="accepted").all()
+    for request_id in request_ids:
+        messages = {pro_id: outcomes[(pro_id, request_id)] for pro_id in professionals}
+        winners = [pro_id for pro_id, message in messages.items() if message == "Request accepted successfully"]
+        assert winners == [claimed[request_id]]
+        assert all(message == "This request has already been taken" for pro_id, message in messages.items() if pro_id not in winners)
+    assert sorted(request_id for request_id, in events) == sorted(request_ids)
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_in_memory_database_works():
+    script = ("import main\n"
+              "with main.app.app_context():\n"
+              "    main.create_tables()\n"
+              "    main.create_search_index()\n"
+              "    main.create_rollup_triggers()\n"
+              "    print(main.db.session.query(main.ServiceRequest).count())\n")
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=dict(os.environ, DATABASE_URL="sqlite://"), capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "0"
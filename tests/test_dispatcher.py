@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+def test_expired_requests_are_shown_in_the_summaries(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        db.session.add(main.ServiceRequest(service_id=service_id, customer_id=customer_id, date_of_request=date.today() - timedelta(days=60)))
+        db.session.commit()
+        assert main.dispatch_requests() == (0, 1)
+        main.update_rollups()
+    login(client, "customer", customer_id, "customer1")
+    page = client.get("/customer/dashboard/summary").get_data(as_text=True)
+    assert '"Expired"' in page and "[0, 0, 0, 1]" in page
+    login(client, "admin", "admin", "admin")
+    page = client.get("/admin/dashboard/summary").get_data(as_text=True)
+    assert '"Expired"' in page and "[0, 0, 0, 0, 1]" in page
+
+def test_dashboards_listen_to_dispatcher_events(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+    login(client, "customer", customer_id, "customer1")
+    page = client.get("/customer/dashboard").get_data(as_text=True)
+    assert '"assigned", "expired"' in page
+
+def add_professional(user_name, pincode, rating):
+    professional = main.ServiceProfessional(user_name=user_name, password="x", first_name="Ravi", description="Plumber", service_type="Plumbing",
+                                            experience=3, contact=len(user_name), pincode=pincode, approval_status="Approved", avg_rating=rating)
+    db.session.add(professional)
+    db.session.commit()
+    return professional.pro_id
+
+# A public request nobody accepted for longer than DISPATCH_ASSIGN_AFTER
+def add_waiting_request():
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users(pincode="560001")
+        best = add_professional("best", "560001", 5)
+        add_professional("far", "110001", 5)
+        new_request = main.ServiceRequest(service_id=service_id, customer_id=customer_id,
+                                          updated_at=datetime.now() - timedelta(seconds=app.config['DISPATCH_ASSIGN_AFTER'] + 60))
+        db.session.add(new_request)
+        db.session.commit()
+        return new_request.id, best
+
+def assigned_to(request_id):
+    with app.app_context():
+        return db.session.get(main.ServiceRequest, request_id).professional_id
+
+def hold_lease(holder, expires_at):
+    with app.app_context():
+        db.session.merge(main.DispatchLease(name="dispatcher", holder=holder, expires_at=expires_at))
+        db.session.commit()
+
+def test_waiting_public_request_goes_to_the_top_ranked_professional(client):
+    request_id, best = add_waiting_request()
+    with app.app_context():
+        assert main.dispatch_requests() == (1, 0)
+        events = [(event.kind, event.request_id, event.professional_id) for event in main.RequestEvent.query.all()]
+        assert main.dispatch_snapshot()["queue_depth"] == 0
+    assert assigned_to(request_id) == best
+    assert events == [("assigned", request_id, best)]
+    # Assigned requests are not dispatched again
+    with app.app_context():
+        assert main.dispatch_requests() == (0, 0)
+
+def test_worker_skips_while_another_holds_the_lease(client):
+    request_id, best = add_waiting_request()
+    hold_lease("another worker", datetime.now() + timedelta(seconds=60))
+    assert main.dispatch_tick() == None
+    assert main.dispatcher["leader"] == False
+    assert assigned_to(request_id) == None
+
+def test_expired_lease_is_taken_over(client):
+    request_id, best = add_waiting_request()
+    hold_lease("crashed worker", datetime.now() - timedelta(seconds=1))
+    assert main.dispatch_tick() == (1, 0)
+    assert main.dispatcher["leader"] == True
+    assert assigned_to(request_id) == best
+    with app.app_context():
+        lease = db.session.get(main.DispatchLease, "dispatcher")
+        assert lease.holder == main.dispatcher["holder"] and lease.expires_at > datetime.now()
+    # The holder renews its own lease
+    assert main.dispatch_tick() == (0, 0)
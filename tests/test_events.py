@@ -0,0 +1,13 @@
+from datetime import datetime, timedelta
+
+import main
+from main import app, db
+
+def test_dispatcher_prunes_old_events_without_readers(client):
+    with app.app_context():
+        db.session.add_all([main.RequestEvent(request_id=1, kind="created", created_at=datetime.now() - timedelta(seconds=app.config['EVENT_RETENTION'] + 60)),
+                            main.RequestEvent(request_id=2, kind="created", created_at=datetime.now())])
+        db.session.commit()
+        assert main.event_broker["subscribers"] == []
+        main.dispatch_requests()
+        assert [event.request_id for event in main.RequestEvent.query.all()] == [2]
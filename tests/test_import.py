@@ -0,0 +1,18 @@
+import json
+
+import main
+from main import app, db
+
+def test_jsonl_lines_that_are_not_objects_are_rejected(client, tmp_path):
+    path = tmp_path / "services.jsonl"
+    lines = [{"name": "Plumbing", "price": 100, "time_required": 1, "description": "Pipes"}, [1, 2], "text", 5,
+             {"name": ["Painting"], "price": 100, "time_required": 1, "description": "Walls"},
+             {"name": "Cleaning", "price": 50, "time_required": 2, "description": "Rooms"}]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n{broken\n")
+    result = app.test_cli_runner().invoke(args=["import-data", "services", str(path), "--batch-size", "1"])
+    assert result.exit_code == 0, result.output
+    assert "2 services imported, 5 rejected" in result.output
+    assert "line 2 rejected: not a JSON object" in result.output
+    assert "line 5 rejected: nested value in name" in result.output
+    with app.app_context():
+        assert sorted(db.session.execute(db.select(main.Services.name)).scalars()) == ["Cleaning", "Plumbing"]
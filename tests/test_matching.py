@@ -0,0 +1,52 @@
+from sqlalchemy import insert
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+def add_professional(user_name, pincode, rating=0, status="Approved"):
+    professional = main.ServiceProfessional(user_name=user_name, password="x", first_name="Ravi", description="Plumber", service_type="Plumbing",
+                                            experience=3, contact=len(user_name), pincode=pincode, approval_status=status, avg_rating=rating)
+    db.session.add(professional)
+    db.session.commit()
+    return professional.pro_id
+
+def ranking(pincode="560001"):
+    with app.app_context():
+        return [professional.user_name for professional, distance, accepted, score in main.match_professionals("Plumbing", pincode)]
+
+def test_ranked_by_distance_then_rating_then_load(client, tmp_path, monkeypatch):
+    centroids = tmp_path / "centroids.csv"
+    centroids.write_text("pincode,latitude,longitude\n560001,12.97,77.59\n560002,12.98,77.60\n560100,13.30,77.90\n")
+    monkeypatch.setitem(app.config, "PINCODE_CENTROIDS", str(centroids))
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users(pincode="560002")
+        add_professional("far", "560100", rating=5)
+        add_professional("near_rated", "560002", rating=5)
+        busy = add_professional("near_rated_busy", "560002", rating=5)
+        db.session.execute(insert(main.ServiceRequest), [{"service_id": service_id, "customer_id": customer_id, "professional_id": busy,
+                                                          "service_status": "Accepted"} for _ in range(3)])
+        db.session.commit()
+    assert ranking() == ["near_rated", "near_rated_busy", "professional1", "far"]
+
+def test_ranked_by_shared_pincode_digits_without_centroids(client):
+    with app.app_context():
+        seed_users(pincode="400001")
+        add_professional("same_city", "560009")
+        add_professional("next_door", "560001")
+    assert ranking() == ["next_door", "same_city", "professional1"]
+
+def test_index_follows_approve_block_unblock_and_reject(client):
+    with app.app_context():
+        seed_users()
+        pro_id = add_professional("newcomer", "560001", status="Pending")
+    assert ranking() == ["professional1"]
+    loaded_at = main.match_index["loaded_at"]
+    admin = app.test_client()
+    login(admin, "admin", "admin", "admin")
+    for action, expected in [("approve", ["newcomer", "professional1"]), ("block", ["professional1"]),
+                             ("unblock", ["newcomer", "professional1"]), ("reject", ["professional1"])]:
+        assert admin.get("/admin/" + action + "/professional/" + str(pro_id)).status_code == 302
+        assert sorted(ranking()) == expected
+    # Updated in place, never rebuilt
+    assert main.match_index["loaded_at"] == loaded_at
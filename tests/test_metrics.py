@@ -0,0 +1,11 @@
+import main
+from conftest import login
+
+def test_prometheus_output_with_an_endpoint_that_only_shed_requests(client):
+    main.rate_limit_shed["employee_login"] = {"ip": 2, "username": 0}
+    login(client, "admin", "admin", "admin")
+    response = client.get("/admin/metrics", query_string={"format": "prometheus"})
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'household_requests_shed_total{endpoint="employee_login",key="ip"} 2' in lines
+    assert not any(line.startswith("household_request_wall_seconds") and "employee_login" in line for line in lines)
@@ -0,0 +1,69 @@
+import pytest
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+STATUSES = ["Pending", "Pending", "Approved", "Approved", "Blocked", "Blocked"]
+
+# Six professionals, two in each status, each logged in once so their identity is cached
+def setup_professionals(client):
+    with app.app_context():
+        service_id, customer_id, first_id = seed_users()
+        ids = []
+        for number, status in enumerate(STATUSES):
+            professional = main.ServiceProfessional(user_name="pro" + str(number), password="x", first_name="Ravi", description="Plumber", service_type="Plumbing",
+                                                    experience=1, contact=10 + number, pincode="56000" + str(number), approval_status=status)
+            db.session.add(professional)
+            db.session.flush()
+            ids.append(professional.pro_id)
+            db.session.add(main.ServiceRequest(service_id=service_id, customer_id=customer_id, professional_id=professional.pro_id))
+        db.session.commit()
+    for pro_id in ids:
+        login(client, "professional", pro_id, "pro")
+        client.get("/professional/dashboard")
+    with app.app_context():
+        main.load_match_index()
+    return ids
+
+def statuses(ids):
+    with app.app_context():
+        return {pro_id: status for pro_id, status in db.session.query(main.ServiceProfessional.pro_id, main.ServiceProfessional.approval_status)
+                .filter(main.ServiceProfessional.pro_id.in_(ids))}
+
+def moderate(client, action, ids):
+    login(client, "admin", "admin", "admin")
+    response = client.post("/admin/professionals/moderate", json={"action": action, "ids": ids})
+    assert response.status_code == 200
+    return {result["id"]: result["result"] for result in response.get_json()["results"]}
+
+@pytest.mark.parametrize("action, selected, new_status", [("approve", 0, "Approved"), ("block", 2, "Blocked"), ("unblock", 4, "Approved")])
+def test_status_changes_touch_only_the_selected_rows(client, action, selected, new_status):
+    ids = setup_professionals(client)
+    before = statuses(ids)
+    target = ids[selected]
+    # The second professional in the same status is left alone, and the ones in other statuses are refused
+    other = ids[selected + 1]
+    wrong = ids[(selected + 2) % len(ids)]
+    results = moderate(client, action, [target, wrong, 999999])
+    assert results == {target: {"approve": "approved", "block": "blocked", "unblock": "unblocked"}[action], wrong: "invalid_status", 999999: "not_found"}
+    after = statuses(ids)
+    assert after[target] == new_status
+    assert {pro_id: status for pro_id, status in after.items() if pro_id != target} == {pro_id: status for pro_id, status in before.items() if pro_id != target}
+    assert ("professional", target) not in main.identity_cache
+    assert ("professional", other) in main.identity_cache and ("professional", wrong) in main.identity_cache
+    assert (target in main.match_index["professionals"]) == (new_status == "Approved")
+
+def test_reject_deletes_only_the_selected_rows(client):
+    ids = setup_professionals(client)
+    results = moderate(client, "reject", [ids[0], ids[2]])
+    assert results == {ids[0]: "deleted", ids[2]: "deleted"}
+    assert set(statuses(ids)) == set(ids) - {ids[0], ids[2]}
+    with app.app_context():
+        assert sorted(row.professional_id for row in main.ArchivedServiceRequest.query.all()) == sorted([ids[0], ids[2]])
+        assert db.session.query(main.ServiceRequest).filter(main.ServiceRequest.professional_id.in_(ids)).count() == len(ids) - 2
+    assert ("professional", ids[0]) not in main.identity_cache and ("professional", ids[2]) not in main.identity_cache
+    assert ("professional", ids[3]) in main.identity_cache
+    assert ids[2] not in main.match_index["professionals"] and ids[3] in main.match_index["professionals"]
+    login(client, "professional", ids[2], "pro2")
+    assert client.get("/professional/dashboard").status_code == 302
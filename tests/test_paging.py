@@ -0,0 +1,14 @@
+import pytest
+
+from main import app
+from conftest import login, seed_users
+
+@pytest.mark.parametrize("cursor", ["[null]", "[[1]]", "[{}]", "[true]", "{}", "[1, 2]", "nonsense"])
+def test_invalid_cursors_are_ignored(client, cursor):
+    with app.app_context():
+        seed_users()
+    login(client, "admin", "admin", "admin")
+    assert client.get("/admin/dashboard", query_string={"after": cursor}).status_code == 200
+    assert client.get("/admin/dashboard", query_string={"pro_before": cursor}).status_code == 200
+    login(client, "customer", 1, "customer1")
+    assert client.get("/customer/dashboard/search", query_string={"after": cursor}).status_code == 200
@@ -0,0 +1,20 @@
+import main
+from main import app, db
+from conftest import login, seed_users
+
+# A service and professional created by another worker, before this worker's catalog stamp changes
+def test_dashboard_of_a_service_missing_from_the_cached_catalog(client):
+    app.config['CATALOG_VERSION_FILE'] = None
+    with app.app_context():
+        seed_users()
+    login(client, "admin", "admin", "admin")
+    assert client.get("/admin/dashboard").status_code == 200
+    with app.app_context():
+        db.session.add(main.Services(name="Gardening", price=200, time_required=2, description="Lawns"))
+        professional = main.ServiceProfessional(user_name="gardener", password="x", first_name="Mala", description="Gardener", service_type="Gardening",
+                                                experience=2, contact=3, pincode="560003", approval_status="Approved")
+        db.session.add(professional)
+        db.session.commit()
+        pro_id = professional.pro_id
+    login(client, "professional", pro_id, "gardener")
+    assert client.get("/professional/dashboard").status_code == 200
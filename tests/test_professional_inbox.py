@@ -0,0 +1,25 @@
+from datetime import date
+
+from sqlalchemy import insert
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+def test_new_public_request_is_on_the_first_page(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        closed = app.config['PAGE_SIZE'] + 10
+        db.session.execute(insert(main.ServiceRequest), [{"service_id": service_id, "customer_id": customer_id, "professional_id": professional_id,
+                                                          "service_status": "Closed", "ratings": 4, "date_of_completion": date.today()} for _ in range(closed)])
+        new_request = main.ServiceRequest(service_id=service_id, customer_id=customer_id)
+        db.session.add(new_request)
+        db.session.commit()
+        new_id = new_request.id
+    login(client, "professional", professional_id, "professional1")
+    page = client.get("/professional/dashboard").get_data(as_text=True)
+    assert "/professional/accept/request/" + str(new_id) + '"' in page
+    # Only the closed requests need a second page
+    assert page.count(">Next<") == 1 and "closed_after" in page
+    second = client.get("/professional/dashboard", query_string={"closed_after": "[%d]" % (closed - app.config['PAGE_SIZE'] + 1)}).get_data(as_text=True)
+    assert "/professional/accept/request/" + str(new_id) + '"' in second
@@ -0,0 +1,52 @@
+from sqlalchemy import event, insert
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+PAGES = [
+    ("/admin/dashboard", {}),
+    ("/admin/dashboard/search", {}),
+    ("/admin/dashboard/search", {"filter": "service_name", "search_input": "Plumbing"}),
+    ("/admin/dashboard/search", {"filter": "professional_name", "search_input": "Ravi"}),
+    ("/admin/dashboard/search", {"filter": "customer_name", "search_input": "Asha"}),
+    ("/admin/dashboard/search", {"filter": "date_of_req", "date_from": "2000-01-01", "date_to": "2100-01-01"}),
+]
+
+def add_requests(count, service_id, customer_id, professional_id):
+    rows = [{"service_id": service_id, "customer_id": customer_id, "professional_id": professional_id if i % 2 else None,
+             "service_status": "Accepted" if i % 2 else "Requested"} for i in range(count)]
+    with app.app_context():
+        db.session.execute(insert(main.ServiceRequest), rows)
+        db.session.commit()
+
+# Statements run by each page
+def statement_counts(client):
+    statements = {"count": 0}
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements["count"] += 1
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+    counts = {}
+    try:
+        for path, arguments in PAGES:
+            statements["count"] = 0
+            response = client.get(path, query_string=arguments)
+            assert response.status_code == 200
+            counts[path + repr(sorted(arguments.items()))] = statements["count"]
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    return counts
+
+def test_admin_pages_run_the_same_statements_for_ten_times_the_rows(client):
+    with app.app_context():
+        ids = seed_users()
+    login(client, "admin", "admin", "admin")
+    add_requests(30, *ids)
+    # Warming up the caches so only the queries of the pages are counted
+    statement_counts(client)
+    few = statement_counts(client)
+    add_requests(270, *ids)
+    many = statement_counts(client)
+    assert few == many
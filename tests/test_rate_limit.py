@@ -0,0 +1,74 @@
+import threading
+
+from sqlalchemy import event
+
+import main
+from main import app, db
+from conftest import seed_users
+
+def count_statements():
+    statements = {"count": 0}
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements["count"] += 1
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+    return statements, count_statement
+
+def test_login_over_the_username_limit_gets_429_before_any_query_or_hash(client, monkeypatch):
+    monkeypatch.setitem(app.config, "RATE_LIMITS", {"ip": (100, 1.0), "username": (5, 0.1)})
+    hashes = []
+    hashing = main.run_password_hashing
+    monkeypatch.setattr(main, "run_password_hashing", lambda function, *args: hashes.append(function) or hashing(function, *args))
+    with app.app_context():
+        seed_users()
+        main.Customer.query.filter_by(user_name="customer1").update({"password": main.generate_password_hash("right", method="pbkdf2:sha256:1000")})
+        db.session.commit()
+    for _ in range(5):
+        assert client.post("/login/customer", data={"username": "customer1", "password": "wrong"}).status_code == 200
+    assert len(hashes) == 5
+    statements, listener = count_statements()
+    try:
+        response = client.post("/login/customer", data={"username": "Customer1 ", "password": "right"})
+    finally:
+        with app.app_context():
+            event.remove(db.engine, "before_cursor_execute", listener)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 10
+    assert b"Too many attempts" in response.data
+    assert statements["count"] == 0 and len(hashes) == 5
+    # Other usernames are not affected
+    assert client.post("/login/customer", data={"username": "someone", "password": "x"}).status_code == 200
+    assert main.metrics_snapshot()["customer_login"]["shed"] == {"ip": 0, "username": 1}
+
+def test_ip_limit_covers_every_username(client, monkeypatch):
+    monkeypatch.setitem(app.config, "RATE_LIMITS", {"ip": (3, 0.01), "username": (100, 1.0)})
+    for number in range(3):
+        assert client.post("/login/employee", data={"username": "user" + str(number), "password": "x"}).status_code == 200
+    response = client.post("/login/employee", data={"username": "user9", "password": "x"})
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
+    # Another client address has its own bucket
+    assert client.post("/login/employee", data={"username": "user9", "password": "x"}, environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
+
+def test_register_429_page_lists_the_services(client, monkeypatch):
+    monkeypatch.setitem(app.config, "RATE_LIMITS", {"ip": (100, 1.0), "username": (0, 0.1)})
+    with app.app_context():
+        seed_users()
+    response = client.post("/register/employee", data={"username": "newcomer"})
+    assert response.status_code == 429
+    assert b"Plumbing" in response.data and b"No services available" not in response.data
+
+# Buckets in RATE_LIMIT_DB are shared by every connection to it, as by several worker processes
+def test_shared_buckets_count_across_connections(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "RATE_LIMIT_DB", str(tmp_path / "rate_limits.sqlite3"))
+    waits = []
+    def take():
+        with app.app_context():
+            waits.append(main.take_token("username:shared", 3, 0.001))
+    for _ in range(3):
+        worker = threading.Thread(target=take)
+        worker.start()
+        worker.join()
+    assert waits == [0, 0, 0]
+    take()
+    assert waits[-1] > 0
+    assert main.rate_buckets == {}
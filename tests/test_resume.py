@@ -0,0 +1,38 @@
+import hashlib
+import io
+import os
+
+import main
+from main import app, db
+from conftest import seed_users
+
+PDF = b"%PDF-1.4\n" + b"resume " * 20000
+
+def register(client, user_name, content, filename="resume.pdf"):
+    return client.post("/register/employee", data={
+        "username": user_name, "password": "secret", "first_name": "Ravi", "last_name": "Iyer", "work_exp": "3", "service": "Plumbing",
+        "service_description": "Plumber", "contact": "99", "pincode": "560001", "resume": (io.BytesIO(content), filename)},
+        content_type="multipart/form-data")
+
+def test_resumes_are_stored_once_under_their_hash(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "UPLOAD_PATH", str(tmp_path))
+    with app.app_context():
+        seed_users()
+    assert register(client, "first", PDF).status_code == 200
+    assert register(client, "second", PDF).status_code == 200
+    filename = hashlib.sha256(PDF).hexdigest() + ".pdf"
+    assert os.listdir(tmp_path) == [filename]
+    assert (tmp_path / filename).read_bytes() == PDF
+    with app.app_context():
+        assert [pro.resume for pro in main.ServiceProfessional.query.filter(main.ServiceProfessional.user_name.in_(["first", "second"]))] == [filename, filename]
+
+def test_invalid_resumes_are_refused(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "UPLOAD_PATH", str(tmp_path))
+    monkeypatch.setitem(app.config, "MAX_RESUME_SIZE", 64 * 1024)
+    with app.app_context():
+        seed_users()
+    assert b"Only PDF files are allowed" in register(client, "fake", b"not a pdf").data
+    assert b"must not be larger" in register(client, "large", PDF).data
+    assert os.listdir(tmp_path) == []
+    with app.app_context():
+        assert main.ServiceProfessional.query.filter(main.ServiceProfessional.user_name.in_(["fake", "large"])).count() == 0
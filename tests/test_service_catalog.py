@@ -0,0 +1,22 @@
+import os
+
+import main
+from main import app, db
+from conftest import login, seed_users
+
+def test_catalog_is_shared_by_default():
+    assert app.config['CATALOG_VERSION_FILE'] != None
+    assert os.path.isabs(app.config['CATALOG_VERSION_FILE'])
+
+# Another worker adds a service and writes a new stamp, this worker reloads its cached catalog
+def test_service_added_by_another_worker_is_seen(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+    login(client, "customer", customer_id, "customer1")
+    assert b"Gardening" not in client.get("/customer/dashboard").data
+    with app.app_context():
+        db.session.add(main.Services(name="Gardening", price=200, time_required=2, description="Lawns"))
+        db.session.commit()
+    with open(app.config['CATALOG_VERSION_FILE'], "w") as file:
+        file.write("written by another worker")
+    assert b"Gardening" in client.get("/customer/dashboard").data
@@ -0,0 +1,58 @@
+from sqlalchemy import text
+
+from main import app, db
+from conftest import login, seed_users
+
+def run(*args):
+    result = app.test_cli_runner().invoke(args=list(args))
+    assert result.exit_code == 0, result.output
+    return result.output
+
+# A database from before the rating totals, the request versions and the rollups, upgraded as the README says
+def test_init_db_upgrades_an_old_database(client):
+    with app.app_context():
+        seed_users()
+        for table, column in [("serviceprofessional", "rating_sum"), ("serviceprofessional", "rating_count"),
+                              ("servicerequest", "updated_at"), ("servicerequest", "version")]:
+            db.session.execute(text("ALTER TABLE " + table + " DROP COLUMN " + column))
+        db.session.commit()
+    run("init-db")
+    login(client, "admin", "admin", "admin")
+    assert client.get("/admin/dashboard").status_code == 200
+    run("rebuild-ratings")
+    assert client.get("/admin/dashboard").status_code == 200
+
+# Requests with dd/mm/YYYY dates, converted after init-db has installed the rollup triggers
+def add_old_requests(professional_id, service_id, customer_id):
+    for day, status in [("18/10/2025", "Closed"), ("18/10/2025", "Requested"), ("02/01/2026", "Accepted")]:
+        db.session.execute(text("INSERT INTO servicerequest (service_id, customer_id, professional_id, date_of_request, service_status, ratings) "
+                                "VALUES (:service_id, :customer_id, :professional_id, :day, :status, 4)"),
+                           {"service_id": service_id, "customer_id": customer_id, "professional_id": professional_id, "day": day, "status": status})
+    db.session.commit()
+
+def test_summaries_work_after_migrating_dates(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        add_old_requests(professional_id, service_id, customer_id)
+    run("init-db")
+    run("migrate-dates")
+    run("rollup-requests", "--full")
+    with app.app_context():
+        rollups = db.session.execute(text("SELECT day, status, requests FROM requestrollup ORDER BY day, status")).all()
+    assert [tuple(row) for row in rollups] == [("2025-10-18", "Closed", 1), ("2025-10-18", "Requested", 1), ("2026-01-02", "Accepted", 1)]
+    login(client, "admin", "admin", "admin")
+    assert client.get("/admin/dashboard/summary").status_code == 200
+    login(client, "professional", professional_id, "professional1")
+    assert client.get("/professional/dashboard/summary").status_code == 200
+
+# Changes logged before migrate-dates cleaned them up are dropped by --full
+def test_full_rollup_clears_pending_changes(client):
+    with app.app_context():
+        service_id, customer_id, professional_id = seed_users()
+        add_old_requests(professional_id, service_id, customer_id)
+        db.session.execute(text("UPDATE servicerequest SET date_of_request = '2025-10-18' WHERE date_of_request = '18/10/2025'"))
+        db.session.execute(text("UPDATE servicerequest SET date_of_request = '2026-01-02' WHERE date_of_request = '02/01/2026'"))
+        db.session.commit()
+    run("rollup-requests", "--full")
+    login(client, "admin", "admin", "admin")
+    assert client.get("/admin/dashboard/summary").status_code == 200